@@ -2,29 +2,46 @@ import os
 import time
 import uuid
 import threading
-import json
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response
 from werkzeug.utils import secure_filename
 from flask_socketio import SocketIO, emit, join_room
 from core.splitter import split_audio
 from core.dispatcher import JobDispatcher
 from core.aggregator import aggregate_results
+from core.packer import pack_files, unpack_results
 from core.redis_manager import RedisManager
+from core.admission import AdmissionController, AdmissionRejected
+from core.workspace import WorkspaceManager, WorkspaceQuotaExceeded
+from core.cancellation import CancellationRegistry, JobCancelled
+from core import metrics, telemetry
 import config
 
 app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['CHUNKS_FOLDER'] = 'uploads/chunks'
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-os.makedirs(app.config['CHUNKS_FOLDER'], exist_ok=True)
+redis_manager = RedisManager(memory_max_bytes=config.MEMORY_STORE_MAX_BYTES)
 
-redis_manager = RedisManager()
+# アップロードとチャンクはジョブ毎の作業ディレクトリに置く
+# (release されずに残ったものは、ジョブ記録がない・終了していれば sweeper が回収する)
+workspaces = WorkspaceManager(
+    config.SCRATCH_ROOT,
+    job_quota_bytes=config.SCRATCH_JOB_QUOTA_BYTES,
+    total_quota_bytes=config.SCRATCH_TOTAL_QUOTA_BYTES,
+    use_tmpfs=config.SCRATCH_USE_TMPFS,
+    sweep_interval_sec=config.SCRATCH_SWEEP_INTERVAL_SEC,
+    orphan_grace_sec=config.SCRATCH_ORPHAN_GRACE_SEC,
+    is_job_active=redis_manager.is_job_active
+)
+workspaces.start_sweeper()
+
+# dispatcher は作り直されるので、キャンセル状態は共有のレジストリに持つ
+cancellations = CancellationRegistry()
 
 worker_urls = redis_manager.get_worker_urls()
-dispatcher = JobDispatcher(worker_urls, redis_manager)
+dispatcher = JobDispatcher(worker_urls, redis_manager, policy=config.DISPATCH_POLICY, cancellation=cancellations)
+# 起動時にヘルスチェックし、前回のプロセスが返却しないまま終了したスロットを回収する
+threading.Thread(target=dispatcher.get_online_workers, daemon=True).start()
 
 
 @app.route('/')
@@ -55,7 +72,7 @@ def add_worker():
     redis_manager.add_worker(worker_url)
     workers = redis_manager.get_worker_urls()
     global dispatcher
-    dispatcher = JobDispatcher(workers, redis_manager)
+    dispatcher = JobDispatcher(workers, redis_manager, policy=config.DISPATCH_POLICY, cancellation=cancellations)
     return jsonify({
         "status": "success",
         "workers": workers
@@ -74,13 +91,30 @@ def remove_worker():
     redis_manager.remove_worker(worker_url)
     workers = redis_manager.get_worker_urls()
     global dispatcher
-    dispatcher = JobDispatcher(workers, redis_manager)
+    dispatcher = JobDispatcher(workers, redis_manager, policy=config.DISPATCH_POLICY, cancellation=cancellations)
     return jsonify({
         "status": "success",
         "workers": workers
     })
 
 
+@app.route('/workers/telemetry', methods=['GET'])
+def get_worker_telemetry():
+    """worker/モデル毎の性能記録 (チャンク長区分ごとの処理時間分布と時系列)"""
+    result = []
+    for worker in redis_manager.get_all_worker_telemetry():
+        for record in worker['models'].values():
+            for bucket in record['buckets'].values():
+                bucket['speed_ratio'] = bucket['processing_sec'] / bucket['audio_sec'] if bucket['audio_sec'] else None
+                bucket['p50_sec'] = telemetry.latency_quantile(bucket, 0.5)
+                bucket['p95_sec'] = telemetry.latency_quantile(bucket, 0.95)
+        result.append(worker)
+    return jsonify({
+        "workers": result,
+        "latency_buckets_sec": list(telemetry.LATENCY_BUCKETS)
+    })
+
+
 @app.route('/preferences/purifier', methods=['POST'])
 def set_purifier_preference():
     data = request.get_json()
@@ -105,95 +139,228 @@ def _emit_job(job_id):
     if job:
         socketio.emit('job_update', job, room=job_id)
 
+admission = AdmissionController(
+    redis_manager,
+    max_concurrent_jobs=config.MAX_CONCURRENT_JOBS,
+    max_queued_jobs=config.MAX_QUEUED_JOBS,
+    priority_classes=config.PRIORITY_CLASSES,
+    on_update=_emit_job
+)
+
+def _storage_name(filename):
+    """保存用のファイル名。secure_filename は非ASCII文字を落とすので、名前が消えたら upload.<拡張子> にする"""
+    stem, ext = os.path.splitext(filename)
+    safe_ext = secure_filename(ext)
+    return f"{secure_filename(stem) or 'upload'}{'.' + safe_ext if safe_ext else ''}"
+
+def _discard_submission(job_id):
+    """受付が完了しなかったジョブの記録と作業ディレクトリを消す"""
+    redis_manager.delete_job(job_id)
+    workspaces.release(job_id)
+
+def _reject_no_space():
+    return jsonify({"error": "Scratch space is full"}), 507
+
+def _fail_job(job_id, error):
+    import traceback
+    print(f"[Master] Error: {error}")
+    print(traceback.format_exc())
+    redis_manager.update_job_fields(job_id, status='failed', error=str(error))
+    _emit_job(job_id)
+
+def _job_cancelled(job_id):
+    print(f"[Master] Job {job_id} cancelled")
+    redis_manager.mark_job_cancelled(job_id)
+    _emit_job(job_id)
+
+def _cancel_job(job_id):
+    """待機中ならキューから外して即キャンセル、実行中なら未送信チャンクの破棄と応答待ちの放棄を指示する"""
+    job = redis_manager.get_job_status(job_id)
+    if not job:
+        return {"error": "Job not found"}, 404
+    if job['status'] in ('completed', 'failed', 'cancelled'):
+        return {"error": f"Job already {job['status']}"}, 409
+    if admission.cancel(job_id):
+        metrics.JOBS_CANCELLED_TOTAL.inc(state='queued')
+        workspaces.release(job_id)
+        _job_cancelled(job_id)
+        return {"status": "cancelled", "job_id": job_id}, 200
+    metrics.JOBS_CANCELLED_TOTAL.inc(state='running')
+    cancellations.cancel(job_id)
+    # 実行中スレッドが次の区切りで cancelled に更新する
+    redis_manager.update_job_fields(job_id, cancel_requested=True)
+    _emit_job(job_id)
+    return {"status": "cancelling", "job_id": job_id}, 202
+
+def _reject_busy(priority):
+    retry_after = admission.retry_after_sec()
+    metrics.ADMISSION_REJECTED_TOTAL.inc(priority=priority)
+    response = jsonify({"error": "Server is busy", "retry_after_sec": retry_after})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+def _run_purifier(job_id, use_purifier):
+    if use_purifier:
+        redis_manager.update_job_status(job_id, 'purifying')
+        _emit_job(job_id)
+        print("[Master] Purifier: Starting noise reduction (mock)...")
+        with metrics.job_stage(redis_manager, job_id, 'purify'):
+            time.sleep(5)
+        print("[Master] Purifier: Complete")
+        redis_manager.update_job_status(job_id, 'purifier_completed')
+        _emit_job(job_id)
+        time.sleep(0.5)
+    else:
+        print("[Master] Purifier: Bypassed (user preference)")
+        redis_manager.update_job_status(job_id, 'purifier_bypassed')
+        _emit_job(job_id)
+        time.sleep(0.5)
+
+def _dispatch_chunks(job_id, chunk_paths, chunk_durations_ms):
+    """チャンクを長い順にexecutorへ投入し、workerの結果をチャンク順で返す"""
+    n = len(chunk_paths)
+    results = [None] * n
+    
+    # チャンクを音声時間でソート（長い順）して処理
+    chunk_indices = list(range(n))
+    chunk_indices.sort(key=lambda i: chunk_durations_ms[i], reverse=True)
+    
+    # 全workerのスロット数まで並列に送る (空きがなければ dispatcher 側で待つ)
+    max_workers = dispatcher.total_slots()
+    def _do_chunk(i, chunk, submitted_at):
+        queue_wait_sec = time.perf_counter() - submitted_at
+        metrics.CHUNK_QUEUE_WAIT_SECONDS.observe(queue_wait_sec)
+        chunk_id = f"{job_id}_chunk_{i}"
+        chunk_dur_sec = chunk_durations_ms[i] / 1000.0 if i < len(chunk_durations_ms) else 0
+        res = dispatcher.process_chunk(chunk, job_id, chunk_id, chunk_duration_sec=chunk_dur_sec,
+                                       queue_wait_sec=queue_wait_sec)
+        try:
+            os.remove(chunk)
+        except Exception as e:
+            print(f"[Master] Warning: Failed to delete {chunk}: {e}")
+        return i, res
+    
+    with metrics.job_stage(redis_manager, job_id, 'dispatch'):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # ソートされた順序で送信
+            futures = {executor.submit(_do_chunk, i, chunk_paths[i], time.perf_counter()): i for i in chunk_indices}
+            for fut in as_completed(futures):
+                if fut.cancelled():
+                    continue
+                i, res = fut.result()
+                results[i] = res
+                if cancellations.is_cancelled(job_id):
+                    # まだ始まっていないチャンクは送らない (応答待ちのものは dispatcher 側で放棄される)
+                    for pending in futures:
+                        pending.cancel()
+                _emit_job(job_id)  # reflect chunk completion
+    cancellations.check(job_id)
+    # 一部のチャンクが欠けたまま completed にしない (worker不在・エラー・接続失敗)
+    missing = [i for i, res in enumerate(results) if res is None]
+    if missing:
+        raise RuntimeError(f"{len(missing)} of {n} chunks got no result from workers")
+    return results
+
+def _finish_job(job_id, final_result):
+    # 結果と完了状態を1回で書き込む (TTLも維持される)
+    redis_manager.update_job_fields(job_id, result=final_result, status='completed')
+    _emit_job(job_id)
+
 def process_job(job_id, filename, filepath, use_purifier):
     try:
-        if use_purifier:
-            redis_manager.update_job_status(job_id, 'purifying')
-            _emit_job(job_id)
-            print("[Master] Purifier: Starting noise reduction (mock)...")
-            time.sleep(5)
-            print("[Master] Purifier: Complete")
-            redis_manager.update_job_status(job_id, 'purifier_completed')
-            _emit_job(job_id)
-            time.sleep(0.5)
-        else:
-            print("[Master] Purifier: Bypassed (user preference)")
-            redis_manager.update_job_status(job_id, 'purifier_bypassed')
-            _emit_job(job_id)
-            time.sleep(0.5)
+        cancellations.check(job_id)
+        _run_purifier(job_id, use_purifier)
+        cancellations.check(job_id)
         redis_manager.update_job_status(job_id, 'splitting')
         _emit_job(job_id)
         print("[Master] Orchard: Starting audio splitting...")
+        split_started_at = time.time()
+        split_timings = {}
         chunk_paths = split_audio(
             filepath,
-            app.config['CHUNKS_FOLDER'],
+            workspaces.path(job_id),
             min_len=config.CHUNK_MIN_LENGTH,
-            silence_thresh=config.SILENCE_THRESH
+            silence_thresh=config.SILENCE_THRESH,
+            timings=split_timings
         )
+        for stage in ('decode', 'detect', 'export'):
+            if stage in split_timings:
+                metrics.record_stage(redis_manager, job_id, stage, split_timings[stage], started_at=split_started_at)
+                split_started_at += split_timings[stage]
         print(f"[Master] Orchard: Created {len(chunk_paths)} chunks")
-        job_data = redis_manager.get_job_status(job_id)
-        if job_data:
-            job_data['total_chunks'] = len(chunk_paths)
-            redis_manager._set(f"job:{job_id}", redis_manager._get(f"job:{job_id}").replace(
-                '"total_chunks": 0', f'"total_chunks": {len(chunk_paths)}'
-            ))
+        workspaces.account(job_id)
+        cancellations.check(job_id)
+        redis_manager.update_job_fields(job_id, total_chunks=len(chunk_paths))
         redis_manager.update_job_status(job_id, 'processing')
         _emit_job(job_id)
         print("[Master] Orchard: Dispatching to workers in parallel...")
         n = len(chunk_paths)
-        results = [None] * n
         chunk_durations_ms = [0] * n
         from pydub import AudioSegment
-        for i, chunk in enumerate(chunk_paths):
-            try:
-                chunk_audio = AudioSegment.from_file(chunk)
-                chunk_durations_ms[i] = len(chunk_audio)
-            except Exception:
-                chunk_durations_ms[i] = 0
-        
-        # チャンクを音声時間でソート（長い順）して処理
-        chunk_indices = list(range(n))
-        chunk_indices.sort(key=lambda i: chunk_durations_ms[i], reverse=True)
+        with metrics.job_stage(redis_manager, job_id, 'probe'):
+            for i, chunk in enumerate(chunk_paths):
+                try:
+                    chunk_audio = AudioSegment.from_file(chunk)
+                    chunk_durations_ms[i] = len(chunk_audio)
+                except Exception:
+                    chunk_durations_ms[i] = 0
         
-        max_workers = max(1, len(dispatcher.workers))
-        def _do_chunk(i, chunk):
-            chunk_id = f"{job_id}_chunk_{i}"
-            chunk_dur_sec = chunk_durations_ms[i] / 1000.0 if i < len(chunk_durations_ms) else 0
-            res = dispatcher.process_chunk(chunk, job_id, chunk_id, chunk_duration_sec=chunk_dur_sec)
-            try:
-                os.remove(chunk)
-            except Exception as e:
-                print(f"[Master] Warning: Failed to delete {chunk}: {e}")
-            return i, res
-        
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # ソートされた順序で送信
-            futures = {executor.submit(_do_chunk, i, chunk_paths[i]): i for i in chunk_indices}
-            for fut in as_completed(futures):
-                i, res = fut.result()
-                results[i] = res
-                _emit_job(job_id)  # reflect chunk completion
+        results = _dispatch_chunks(job_id, chunk_paths, chunk_durations_ms)
         redis_manager.update_job_status(job_id, 'aggregating')
         _emit_job(job_id)
         print("[Master] Orchard: Aggregating results...")
-        final_result = aggregate_results(results, chunk_durations_ms)
-        try:
-            os.remove(filepath)
-        except Exception as e:
-            print(f"[Master] Warning: Failed to delete {filepath}: {e}")
-        job_final = redis_manager.get_job_status(job_id)
-        if job_final:
-            job_final['result'] = final_result
-            redis_manager._set(f"job:{job_id}", json.dumps(job_final))
-        redis_manager.update_job_status(job_id, 'completed')
-        _emit_job(job_id)
+        with metrics.job_stage(redis_manager, job_id, 'aggregate'):
+            final_result = aggregate_results(results, chunk_durations_ms)
+        _finish_job(job_id, final_result)
         print("[Master] Complete! Async job finished.")
+    except JobCancelled:
+        _job_cancelled(job_id)
     except Exception as e:
-        import traceback
-        print(f"[Master] Error: {e}")
-        print(traceback.format_exc())
-        redis_manager.update_job_status(job_id, 'failed')
+        _fail_job(job_id, e)
+    finally:
+        # アップロードと残ったチャンクをまとめて削除
+        workspaces.release(job_id)
+        cancellations.forget(job_id)
+
+def process_batch(job_id, filenames, filepaths, use_purifier):
+    """複数ファイルを1ジョブとして処理する。短いファイルは連結して送信回数を減らす"""
+    try:
+        cancellations.check(job_id)
+        _run_purifier(job_id, use_purifier)
+        cancellations.check(job_id)
+        redis_manager.update_job_status(job_id, 'splitting')
+        _emit_job(job_id)
+        print(f"[Master] Orchard: Packing {len(filepaths)} files...")
+        with metrics.job_stage(redis_manager, job_id, 'pack'):
+            units = pack_files(
+                filepaths,
+                workspaces.path(job_id),
+                unit_prefix=job_id,
+                min_len=config.CHUNK_MIN_LENGTH,
+                gap_ms=config.BATCH_PACK_GAP_MS,
+                silence_thresh=config.SILENCE_THRESH
+            )
+        print(f"[Master] Orchard: Packed into {len(units)} units")
+        workspaces.account(job_id)
+        cancellations.check(job_id)
+        redis_manager.update_job_fields(job_id, total_chunks=len(units))
+        redis_manager.update_job_status(job_id, 'processing')
+        _emit_job(job_id)
+        results = _dispatch_chunks(job_id, [u['path'] for u in units], [u['duration_ms'] for u in units])
+        redis_manager.update_job_status(job_id, 'aggregating')
         _emit_job(job_id)
+        with metrics.job_stage(redis_manager, job_id, 'aggregate'):
+            final_result = unpack_results(units, results, filenames)
+        _finish_job(job_id, final_result)
+        print("[Master] Complete! Batch job finished.")
+    except JobCancelled:
+        _job_cancelled(job_id)
+    except Exception as e:
+        _fail_job(job_id, e)
+    finally:
+        # アップロードされたファイルとunitを削除 (ディレクトリ取込の元ファイルは作業ディレクトリ外なので残る)
+        workspaces.release(job_id)
+        cancellations.forget(job_id)
 
 @app.route('/submit', methods=['POST'])
 def submit_job():
@@ -202,18 +369,128 @@ def submit_job():
     file = request.files['file']
     if file.filename == '':
         return jsonify({"error": "No filename"}), 400
+    priority = request.form.get('priority', config.DEFAULT_PRIORITY)
+    if not admission.validate_priority(priority):
+        return jsonify({"error": f"Unknown priority: {priority}"}), 400
+    # 満杯なら保存前に断る
+    snapshot = admission.snapshot()
+    if snapshot['running'] >= snapshot['max_concurrent_jobs'] and snapshot['queued'] >= snapshot['max_queued_jobs']:
+        return _reject_busy(priority)
+    if not workspaces.has_room(request.content_length):
+        return _reject_no_space()
     job_id = str(uuid.uuid4())
-    filename = secure_filename(file.filename)
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
-    print(f"[Master] File saved: {filepath}")
-    user_id = 'default_user'
-    use_purifier = redis_manager.get_user_preference(user_id, 'use_purifier', default=True)
-    redis_manager.create_job(job_id, filename)
+    filename = _storage_name(file.filename)
+    # 受付 (admission.submit) が終わるまでの失敗では作業ディレクトリを残さない
+    try:
+        filepath = os.path.join(workspaces.create(job_id), filename)
+        upload_started_at = time.time()
+        upload_start = time.perf_counter()
+        file.save(filepath)
+        upload_sec = time.perf_counter() - upload_start
+        print(f"[Master] File saved: {filepath}")
+        try:
+            workspaces.account(job_id)
+        except WorkspaceQuotaExceeded as e:
+            workspaces.release(job_id)
+            return jsonify({"error": str(e)}), 413
+        user_id = 'default_user'
+        use_purifier = redis_manager.get_user_preference(user_id, 'use_purifier', default=True)
+        redis_manager.create_job(job_id, filename, priority=priority)
+        metrics.record_stage(redis_manager, job_id, 'upload', upload_sec, started_at=upload_started_at)
+        try:
+            admission.submit(job_id, process_job, args=(filename, filepath, use_purifier), priority=priority)
+        except AdmissionRejected:
+            _discard_submission(job_id)
+            return _reject_busy(priority)
+    except Exception:
+        _discard_submission(job_id)
+        raise
+    _emit_job(job_id)
+    job = redis_manager.get_job_status(job_id) or {}
+    return jsonify({
+        "status": "accepted",
+        "job_id": job_id,
+        "priority": priority,
+        "queue_position": job.get('queue_position', 0),
+        "eta_sec": job.get('eta_sec', 0)
+    })
+
+@app.route('/submit/batch', methods=['POST'])
+def submit_batch():
+    """複数ファイル (files) またはサーバー上のディレクトリ (directory) を1ジョブとして投入"""
+    priority = request.form.get('priority', 'batch')
+    if not admission.validate_priority(priority):
+        return jsonify({"error": f"Unknown priority: {priority}"}), 400
+    files = [f for f in request.files.getlist('files') if f.filename]
+    directory = request.form.get('directory', '').strip()
+    if not files and not directory:
+        return jsonify({"error": "No files"}), 400
+    snapshot = admission.snapshot()
+    if snapshot['running'] >= snapshot['max_concurrent_jobs'] and snapshot['queued'] >= snapshot['max_queued_jobs']:
+        return _reject_busy(priority)
+    if not workspaces.has_room(request.content_length):
+        return _reject_no_space()
+
+    job_id = str(uuid.uuid4())
+    filenames = []
+    filepaths = []
+    if directory:
+        # BATCH_IMPORT_FOLDER 配下のみ許可
+        root = os.path.realpath(config.BATCH_IMPORT_FOLDER)
+        target = os.path.realpath(os.path.join(root, directory))
+        if os.path.commonpath([root, target]) != root or not os.path.isdir(target):
+            return jsonify({"error": "Invalid directory"}), 400
+        for name in sorted(os.listdir(target)):
+            path = os.path.join(target, name)
+            if os.path.isfile(path) and os.path.splitext(name)[1].lower() in config.AUDIO_EXTENSIONS:
+                filenames.append(name)
+                filepaths.append(path)
+        if not filepaths:
+            return jsonify({"error": "No audio files"}), 400
+        if len(filepaths) > config.BATCH_MAX_FILES:
+            return jsonify({"error": f"Too many files (max {config.BATCH_MAX_FILES})"}), 400
+    elif len(files) > config.BATCH_MAX_FILES:
+        return jsonify({"error": f"Too many files (max {config.BATCH_MAX_FILES})"}), 400
+
+    # 受付 (admission.submit) が終わるまでの失敗では作業ディレクトリを残さない
+    try:
+        workspace = workspaces.create(job_id)
+        if not directory:
+            for i, file in enumerate(files):
+                filename = _storage_name(file.filename)
+                # バッチ内の同名ファイルを区別するため連番を付ける
+                filepath = os.path.join(workspace, f"{i:03d}_{filename}")
+                file.save(filepath)
+                filenames.append(filename)
+                filepaths.append(filepath)
+            try:
+                workspaces.account(job_id)
+            except WorkspaceQuotaExceeded as e:
+                workspaces.release(job_id)
+                return jsonify({"error": str(e)}), 413
+        print(f"[Master] Batch received: {len(filepaths)} files")
+
+        use_purifier = redis_manager.get_user_preference('default_user', 'use_purifier', default=True)
+        redis_manager.create_job(job_id, f"batch ({len(filenames)} files)", priority=priority)
+        redis_manager.update_job_fields(job_id, type='batch', files=filenames)
+        try:
+            admission.submit(job_id, process_batch, args=(filenames, filepaths, use_purifier), priority=priority)
+        except AdmissionRejected:
+            _discard_submission(job_id)
+            return _reject_busy(priority)
+    except Exception:
+        _discard_submission(job_id)
+        raise
     _emit_job(job_id)
-    thread = threading.Thread(target=process_job, args=(job_id, filename, filepath, use_purifier), daemon=True)
-    thread.start()
-    return jsonify({"status": "accepted", "job_id": job_id})
+    job = redis_manager.get_job_status(job_id) or {}
+    return jsonify({
+        "status": "accepted",
+        "job_id": job_id,
+        "files_count": len(filenames),
+        "priority": priority,
+        "queue_position": job.get('queue_position', 0),
+        "eta_sec": job.get('eta_sec', 0)
+    })
 
 @app.route('/jobs', methods=['GET'])
 def get_jobs():
@@ -223,6 +500,11 @@ def get_jobs():
         "count": len(jobs)
     })
 
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    body, status = _cancel_job(job_id)
+    return jsonify(body), status
+
 @app.route('/jobs/<job_id>', methods=['GET'])
 def get_job_status(job_id):
     job = redis_manager.get_job_status(job_id)
@@ -234,7 +516,31 @@ def get_job_status(job_id):
 @app.route('/stats', methods=['GET'])
 def get_stats():
     stats = redis_manager.get_stats()
+    stats['admission'] = admission.snapshot()
+    stats['scratch'] = workspaces.snapshot()
     return jsonify(stats)
+
+def _collect_store_gauges():
+    """スクレイプ時にジョブ状態別の件数とworkerのpending_chunks・スロット使用状況を反映"""
+    metrics.JOBS_BY_STATUS.clear()
+    for job in redis_manager.get_all_jobs(limit=None):
+        metrics.JOBS_BY_STATUS.inc(status=job.get('status', 'unknown'))
+    metrics.WORKER_PENDING_CHUNKS.clear()
+    metrics.WORKER_SLOTS.clear()
+    metrics.WORKER_SLOTS_IN_USE.clear()
+    for worker in redis_manager.get_all_workers():
+        metrics.WORKER_PENDING_CHUNKS.set(worker.get('pending_chunks', 0), worker=worker['url'])
+        metrics.WORKER_SLOTS.set(worker.get('slots', 1), worker=worker['url'])
+        metrics.WORKER_SLOTS_IN_USE.set(worker.get('slots_in_use', 0), worker=worker['url'])
+    backend = redis_manager.backend_info()
+    if backend:
+        metrics.STORE_MEMORY_BYTES.set(backend['bytes'])
+
+metrics.REGISTRY.add_collector(_collect_store_gauges)
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render_metrics(), mimetype='text/plain; version=0.0.4')
 @socketio.on('subscribe_job')
 def subscribe_job(data):
     job_id = data.get('job_id')
@@ -243,5 +549,14 @@ def subscribe_job(data):
     join_room(job_id)
     _emit_job(job_id)
 
+@socketio.on('cancel_job')
+def cancel_job_event(data):
+    """結果は ack として返す (進捗は job_update で届く)"""
+    job_id = (data or {}).get('job_id')
+    if not job_id:
+        return {"error": "job_id is required"}
+    body, _ = _cancel_job(job_id)
+    return body
+
 if __name__ == '__main__':
     socketio.run(app, host='0.0.0.0', port=5000, debug=True, use_reloader=False)
@@ -0,0 +1,56 @@
+import math
+import random
+from array import array
+from pydub import AudioSegment
+
+FRAME_RATE = 16000
+SYLLABLE_MS = 200
+
+
+def _make_syllable(rng, frame_rate=FRAME_RATE, length_ms=SYLLABLE_MS):
+    """音節っぽい短い波形 (基本周波数+倍音+ノイズ, ハニング窓) を生成"""
+    n = frame_rate * length_ms // 1000
+    f0 = rng.uniform(110, 260)
+    formant = rng.uniform(500, 1500)
+    samples = array('h')
+    for i in range(n):
+        t = i / frame_rate
+        env = 0.5 - 0.5 * math.cos(2 * math.pi * i / n)
+        v = (0.55 * math.sin(2 * math.pi * f0 * t)
+             + 0.25 * math.sin(2 * math.pi * 2 * f0 * t)
+             + 0.15 * math.sin(2 * math.pi * formant * t)
+             + 0.05 * rng.uniform(-1, 1))
+        samples.append(int(v * env * 12000))
+    return samples.tobytes()
+
+
+def generate_speech_audio(duration_sec, seed=0, utterance_range=(2.0, 12.0),
+                          pause_range=(0.8, 4.0), frame_rate=FRAME_RATE):
+    """発話区間と無音区間が交互に並ぶ合成音声を生成する
+
+    - 発話: 数パターンの音節を seed 固定の乱数で並べたもの
+    - 無音: pause_range 秒のデジタル無音 (splitterの無音検出対象)
+    同じ seed なら常に同じ波形になるので、コミット間で比較可能
+    """
+    rng = random.Random(seed)
+    syllables = [_make_syllable(rng, frame_rate) for _ in range(8)]
+    bytes_per_ms = frame_rate * 2 // 1000
+
+    total_ms = int(duration_sec * 1000)
+    out = bytearray()
+    while len(out) < total_ms * bytes_per_ms:
+        utter_ms = int(rng.uniform(*utterance_range) * 1000)
+        for _ in range(max(1, utter_ms // SYLLABLE_MS)):
+            out += syllables[rng.randrange(len(syllables))]
+        pause_ms = int(rng.uniform(*pause_range) * 1000)
+        out += bytes(pause_ms * bytes_per_ms)
+
+    out = out[:total_ms * bytes_per_ms]
+    return AudioSegment(data=bytes(out), sample_width=2, frame_rate=frame_rate, channels=1)
+
+
+def write_speech_wav(path, duration_sec, seed=0, **kwargs):
+    """generate_speech_audio の結果をWAVとして書き出す"""
+    audio = generate_speech_audio(duration_sec, seed=seed, **kwargs)
+    audio.export(path, format="wav")
+    return path
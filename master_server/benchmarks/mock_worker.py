@@ -0,0 +1,157 @@
+import io
+import time
+import wave
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from flask import Flask, request, jsonify
+from werkzeug.serving import make_server
+from core.aggregator import _format_timestamp
+
+
+def _wav_duration_sec(payload):
+    try:
+        with wave.open(io.BytesIO(payload), 'rb') as w:
+            return w.getnframes() / float(w.getframerate())
+    except Exception:
+        return 0.0
+
+
+class MockWorker:
+    """Flutter WhisperServer の代わりに /transcribe を返すローカルサーバー
+
+    処理時間 = 音声長 * speed_ratio * (1 + N(0, jitter)) * time_scale + overhead_sec
+    slots 個までのリクエストを同時に処理し、それ以上は待たせる (実機は1)
+    """
+
+    def __init__(self, name, speed_ratio=0.5, jitter=0.1, time_scale=1.0,
+                 overhead_sec=0.0, slots=1, segment_sec=5.0, seed=0, host='127.0.0.1'):
+        self.name = name
+        self.speed_ratio = speed_ratio
+        self.jitter = jitter
+        self.time_scale = time_scale
+        self.overhead_sec = overhead_sec
+        self.slots = slots
+        self.segment_ms = max(1, int(segment_sec * 1000))
+        self.host = host
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._slot_sem = threading.Semaphore(slots)
+        self._stats_lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self.reset_stats()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self._server.server_port}"
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.requests = 0
+            self.busy_sec = 0.0
+            self.audio_sec = 0.0
+
+    def _latency(self, duration_sec):
+        with self._rng_lock:
+            noise = self._rng.gauss(0, self.jitter) if self.jitter > 0 else 0.0
+        factor = max(0.0, 1.0 + noise)
+        return duration_sec * self.speed_ratio * factor * self.time_scale + self.overhead_sec
+
+    def _build_app(self):
+        app = Flask(f"mock_worker_{self.name}")
+
+        @app.route('/', methods=['GET'])
+        def health():
+            return jsonify({'status': 'active', 'model': f"mock-{self.name}", 'slots': self.slots})
+
+        @app.route('/transcribe', methods=['POST'])
+        def transcribe():
+            payload = request.get_data()
+            if not payload:
+                return "No audio data", 400
+            duration_sec = _wav_duration_sec(payload)
+            with self._slot_sem:
+                start = time.time()
+                time.sleep(self._latency(duration_sec))
+                elapsed = time.time() - start
+            with self._stats_lock:
+                self.requests += 1
+                self.busy_sec += elapsed
+                self.audio_sec += duration_sec
+            duration_ms = int(duration_sec * 1000)
+            # 実機と同様に数秒毎のセグメントを返す
+            segments = []
+            for start_ms in range(0, duration_ms, self.segment_ms):
+                end_ms = min(start_ms + self.segment_ms, duration_ms)
+                segments.append({
+                    "start": _format_timestamp(start_ms),
+                    "end": _format_timestamp(end_ms),
+                    "start_ms": start_ms,
+                    "end_ms": end_ms,
+                    "text": f"mock {start_ms}-{end_ms}"
+                })
+            return jsonify({
+                "text": "".join(seg["text"] for seg in segments),
+                "time_ms": int(elapsed * 1000),
+                "metadata": {
+                    "model": f"mock-{self.name}",
+                    "language": "ja",
+                    "request_id": f"{int(start * 1000)}-{self.requests:04d}",
+                    "server_time": datetime.now(timezone.utc).isoformat(),
+                    "segments_count": len(segments)
+                },
+                "segments": segments
+            })
+
+        return app
+
+    def start(self):
+        # リクエスト毎のアクセスログを抑止
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        self._server = make_server(self.host, 0, self._build_app(), threaded=True)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class MockWorkerFleet:
+    """複数の MockWorker をまとめて起動/停止する"""
+
+    def __init__(self, specs, time_scale=1.0, seed=0):
+        self.workers = [
+            MockWorker(
+                name=spec.get('name', f"w{i}"),
+                speed_ratio=spec.get('speed_ratio', 0.5),
+                jitter=spec.get('jitter', 0.1),
+                time_scale=spec.get('time_scale', time_scale),
+                overhead_sec=spec.get('overhead_sec', 0.0),
+                slots=spec.get('slots', 1),
+                seed=seed + i
+            )
+            for i, spec in enumerate(specs)
+        ]
+
+    def __enter__(self):
+        for w in self.workers:
+            w.start()
+        return self
+
+    def __exit__(self, *exc):
+        for w in self.workers:
+            w.stop()
+
+    @property
+    def urls(self):
+        return [w.url for w in self.workers]
+
+    def reset_stats(self):
+        for w in self.workers:
+            w.reset_stats()
@@ -0,0 +1,129 @@
+"""ベンチマーク実行スクリプト
+
+    cd master_server
+    python -m benchmarks.run --out bench_base.json
+    python -m benchmarks.run --compare bench_base.json
+"""
+import io
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import contextlib
+from datetime import datetime
+from benchmarks.scenarios import SCENARIOS
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def _parse_worker_specs(text):
+    """'0.3,0.6,1.2' 形式 (speed_ratio のリスト) または JSON リストを受け付ける"""
+    text = text.strip()
+    if text.startswith('['):
+        return json.loads(text)
+    return [{'name': f"w{i}", 'speed_ratio': float(v)} for i, v in enumerate(text.split(','))]
+
+
+def _flatten(metrics, prefix=''):
+    flat = {}
+    for key, value in metrics.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def print_report(report, baseline=None):
+    print(f"== benchmark @ {report['meta'].get('revision')} (store={report['meta']['store']}) ==")
+    base_results = baseline['results'] if baseline else {}
+    if baseline:
+        print(f"   baseline @ {baseline['meta'].get('revision')}")
+    for name, metrics in report['results'].items():
+        print(f"[{name}]")
+        base_flat = _flatten(base_results.get(name, {}))
+        for key, value in _flatten(metrics).items():
+            line = f"  {key:<36} {value:>12.4f}"
+            if key in base_flat:
+                old = base_flat[key]
+                delta = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+                line += f"   (base {old:.4f}, {delta})"
+            print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="whisper-orchard master benchmark")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"カンマ区切り ({', '.join(SCENARIOS)})")
+    parser.add_argument('--store', choices=['memory', 'redis'], default='memory')
+    parser.add_argument('--duration', type=float, default=600, help="合成音声の長さ (秒)")
+    parser.add_argument('--workers', default='0.3,0.6,1.2',
+                        help="模擬ワーカーのspeed_ratio (カンマ区切り) またはJSONリスト")
+    parser.add_argument('--jitter', type=float, default=0.1)
+    parser.add_argument('--time-scale', type=float, default=0.02,
+                        help="模擬推論時間に掛ける係数 (ベンチ短縮用)")
+    parser.add_argument('--overhead-chunks', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help="JSONレポートの出力先")
+    parser.add_argument('--compare', help="比較対象のJSONレポート")
+    parser.add_argument('--verbose', action='store_true', help="splitter/dispatcherのログを表示")
+    args = parser.parse_args(argv)
+
+    worker_specs = _parse_worker_specs(args.workers)
+    for spec in worker_specs:
+        spec.setdefault('jitter', args.jitter)
+
+    params = {
+        'store': args.store,
+        'duration_sec': args.duration,
+        'worker_specs': worker_specs,
+        'workers': len(worker_specs),
+        'chunks': args.overhead_chunks,
+        'time_scale': args.time_scale,
+        'seed': args.seed,
+    }
+    report = {
+        'meta': {
+            'revision': _git_revision(),
+            'timestamp': datetime.now().isoformat(),
+            'store': args.store,
+            'params': params,
+        },
+        'results': {}
+    }
+
+    names = [n.strip() for n in args.scenarios.split(',') if n.strip()]
+    for name in names:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario: {name}")
+
+    with tempfile.TemporaryDirectory(prefix='orchard_bench_') as workdir:
+        for name in names:
+            print(f"[Bench] Running {name}...", file=sys.stderr)
+            log = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+            with log:
+                report['results'][name] = SCENARIOS[name](workdir, **params)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"[Bench] Report written to {args.out}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+import os
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pydub import AudioSegment
+from core.splitter import split_audio
+from core.dispatcher import JobDispatcher
+from core.aggregator import aggregate_results
+from core.redis_manager import RedisManager
+from benchmarks.audio_gen import write_speech_wav
+from benchmarks.mock_worker import MockWorkerFleet
+import config
+
+
+class StoreOpCounter:
+    """RedisManager の _set/_get/_delete/_keys/_update を数える
+    Redis使用時は _update 以外が1回=1往復 (_update は WATCH/GET/EXEC の3往復)
+    """
+
+    OPS = ('_set', '_get', '_delete', '_keys', '_update')
+
+    def __init__(self, redis_manager):
+        self._lock = threading.Lock()
+        self.reset()
+        for op in self.OPS:
+            setattr(redis_manager, op, self._wrap(op, getattr(redis_manager, op)))
+
+    def _wrap(self, op, fn):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.counts[op] += 1
+                    self.elapsed_sec += elapsed
+        return wrapper
+
+    def reset(self):
+        with self._lock:
+            self.counts = {op: 0 for op in self.OPS}
+            self.elapsed_sec = 0.0
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+
+def make_store(kind='memory', host='localhost', port=6379, db=15):
+    """ベンチ用ストア。redis指定時は本番と衝突しないよう別DBを使う
+
+    redis指定で接続できなかった場合はメモリにフォールバックさせず失敗する
+    (store=redis と記録されたレポートがメモリの数値になり、比較できなくなるため)
+    """
+    redis_manager = RedisManager(host=host, port=port, db=db, use_redis=(kind == 'redis'))
+    if kind == 'redis' and not redis_manager.use_redis:
+        raise ConnectionError(f"Redis is not reachable at {host}:{port} (requested --store redis)")
+    return redis_manager
+
+
+def _cleanup_store(redis_manager, worker_urls, job_ids):
+    for url in worker_urls:
+        redis_manager.remove_worker(url)
+        redis_manager.delete_worker_telemetry(url)
+    for job_id in job_ids:
+        redis_manager.delete_job(job_id)
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _dispatch_chunks(dispatcher, redis_manager, job_id, chunk_paths):
+    """process_job と同じ手順 (LPT順でexecutorに投入) でチャンクを処理する"""
+    n = len(chunk_paths)
+    results = [None] * n
+    chunk_durations_ms = [len(AudioSegment.from_file(p)) for p in chunk_paths]
+    chunk_indices = sorted(range(n), key=lambda i: chunk_durations_ms[i], reverse=True)
+    latencies = [0.0] * n
+
+    def _do_chunk(i):
+        start = time.perf_counter()
+        res = dispatcher.process_chunk(
+            chunk_paths[i], job_id, f"{job_id}_chunk_{i}",
+            chunk_duration_sec=chunk_durations_ms[i] / 1000.0
+        )
+        latencies[i] = time.perf_counter() - start
+        return i, res
+
+    max_workers = dispatcher.total_slots()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_do_chunk, i) for i in chunk_indices]
+        for fut in as_completed(futures):
+            i, res = fut.result()
+            results[i] = res
+    makespan = time.perf_counter() - start
+    return results, chunk_durations_ms, latencies, makespan
+
+
+def scenario_split(workdir, duration_sec=600, seed=0, repeat=3, **_):
+    """split_audio 単体の所要時間 (読込+デコード+無音検出+書き出し)"""
+    wav_path = write_speech_wav(os.path.join(workdir, 'split_input.wav'), duration_sec, seed=seed)
+    timings = []
+    chunk_count = 0
+    for r in range(repeat):
+        out_dir = os.path.join(workdir, f'split_chunks_{r}')
+        os.makedirs(out_dir, exist_ok=True)
+        start = time.perf_counter()
+        chunk_paths = split_audio(
+            wav_path, out_dir,
+            min_len=config.CHUNK_MIN_LENGTH,
+            silence_thresh=config.SILENCE_THRESH,
+            silence_len=config.SILENCE_LEN
+        )
+        timings.append(time.perf_counter() - start)
+        chunk_count = len(chunk_paths)
+    split_sec = _percentile(timings, 50)
+    return {
+        'audio_sec': duration_sec,
+        'chunks': chunk_count,
+        'split_sec': split_sec,
+        'split_sec_min': min(timings),
+        'split_realtime_factor': split_sec / duration_sec if duration_sec else 0.0
+    }
+
+
+def scenario_dispatch_overhead(workdir, store='memory', workers=3, chunks=60,
+                               chunk_sec=5.0, seed=0, **_):
+    """推論時間ゼロのワーカーに逐次送信し、1チャンクあたりのマスター側オーバーヘッドを測る"""
+    chunk_path = write_speech_wav(os.path.join(workdir, 'overhead_chunk.wav'), chunk_sec, seed=seed)
+    specs = [{'name': f"zero{i}", 'speed_ratio': 0.0, 'jitter': 0.0} for i in range(workers)]
+    redis_manager = make_store(store)
+    counter = StoreOpCounter(redis_manager)
+    job_id = f"bench-{uuid.uuid4()}"
+
+    with MockWorkerFleet(specs, seed=seed) as fleet:
+        for url in fleet.urls:
+            redis_manager.add_worker(url)
+        redis_manager.create_job(job_id, 'overhead_chunk.wav', total_chunks=chunks)
+        dispatcher = JobDispatcher(fleet.urls, redis_manager)
+        counter.reset()
+        latencies = []
+        failures = 0
+        for i in range(chunks):
+            start = time.perf_counter()
+            res = dispatcher.process_chunk(chunk_path, job_id, f"{job_id}_chunk_{i}", chunk_duration_sec=chunk_sec)
+            latencies.append(time.perf_counter() - start)
+            if res is None:
+                failures += 1
+        ops = dict(counter.counts)
+        store_sec = counter.elapsed_sec
+        _cleanup_store(redis_manager, fleet.urls, [job_id])
+
+    return {
+        'chunks': chunks,
+        'failures': failures,
+        'overhead_ms_mean': sum(latencies) / len(latencies) * 1000,
+        'overhead_ms_p50': _percentile(latencies, 50) * 1000,
+        'overhead_ms_p95': _percentile(latencies, 95) * 1000,
+        'store_ops_per_chunk': sum(ops.values()) / chunks,
+        'store_ms_per_chunk': store_sec / chunks * 1000,
+        'store_ops': ops
+    }
+
+
+def scenario_end_to_end(workdir, store='memory', duration_sec=600, worker_specs=None,
+                        time_scale=0.02, seed=0, **_):
+    """分割→並列ディスパッチ→集約までを模擬ワーカー群で通しで実行する"""
+    worker_specs = worker_specs or [
+        {'name': 'fast', 'speed_ratio': 0.3},
+        {'name': 'mid', 'speed_ratio': 0.6},
+        {'name': 'slow', 'speed_ratio': 1.2},
+    ]
+    wav_path = write_speech_wav(os.path.join(workdir, 'e2e_input.wav'), duration_sec, seed=seed)
+    chunks_dir = os.path.join(workdir, 'e2e_chunks')
+    os.makedirs(chunks_dir, exist_ok=True)
+    redis_manager = make_store(store)
+    counter = StoreOpCounter(redis_manager)
+    job_id = f"bench-{uuid.uuid4()}"
+
+    with MockWorkerFleet(worker_specs, time_scale=time_scale, seed=seed) as fleet:
+        for url in fleet.urls:
+            redis_manager.add_worker(url)
+        dispatcher = JobDispatcher(fleet.urls, redis_manager)
+        # ヘルスチェックでスロット数を取得 (マスターの /workers と同じ)
+        dispatcher.get_online_workers()
+        redis_manager.create_job(job_id, 'e2e_input.wav')
+        total_start = time.perf_counter()
+
+        start = time.perf_counter()
+        chunk_paths = split_audio(
+            wav_path, chunks_dir,
+            min_len=config.CHUNK_MIN_LENGTH,
+            silence_thresh=config.SILENCE_THRESH,
+            silence_len=config.SILENCE_LEN
+        )
+        split_sec = time.perf_counter() - start
+
+        counter.reset()
+        fleet.reset_stats()
+        results, durations_ms, latencies, makespan = _dispatch_chunks(
+            dispatcher, redis_manager, job_id, chunk_paths
+        )
+        ops = dict(counter.counts)
+
+        start = time.perf_counter()
+        aggregate_results(results, durations_ms)
+        aggregate_sec = time.perf_counter() - start
+        total_sec = time.perf_counter() - total_start
+
+        per_worker = {}
+        busy_total = 0.0
+        for w in fleet.workers:
+            busy_total += w.busy_sec
+            per_worker[w.name] = {
+                'requests': w.requests,
+                'audio_sec': round(w.audio_sec, 3),
+                'utilization': w.busy_sec / (w.slots * makespan) if makespan else 0.0
+            }
+        _cleanup_store(redis_manager, fleet.urls, [job_id])
+
+    n = len(chunk_paths)
+    # 理想的な分配時の下限: 総作業量 / 全ワーカーの処理能力
+    capacity = sum(s.get('slots', 1) / (s.get('speed_ratio', 0.5) * time_scale)
+                   for s in worker_specs if s.get('speed_ratio', 0.5) > 0)
+    ideal_makespan = (sum(durations_ms) / 1000.0) / capacity if capacity else 0.0
+    return {
+        'audio_sec': duration_sec,
+        'chunks': n,
+        'failures': sum(1 for r in results if r is None),
+        'split_sec': split_sec,
+        'makespan_sec': makespan,
+        'ideal_makespan_sec': ideal_makespan,
+        'makespan_vs_ideal': makespan / ideal_makespan if ideal_makespan else 0.0,
+        'aggregate_sec': aggregate_sec,
+        'total_sec': total_sec,
+        'chunk_latency_p50_sec': _percentile(latencies, 50),
+        'chunk_latency_p95_sec': _percentile(latencies, 95),
+        'utilization_mean': busy_total / (sum(w.slots for w in fleet.workers) * makespan) if makespan else 0.0,
+        'store_ops_per_chunk': sum(ops.values()) / n if n else 0.0,
+        'store_ops': ops,
+        'workers': per_worker
+    }
+
+
+SCENARIOS = {
+    'split': scenario_split,
+    'dispatch_overhead': scenario_dispatch_overhead,
+    'end_to_end': scenario_end_to_end,
+}
@@ -0,0 +1,78 @@
+"""ディスパッチポリシーのオフライン比較
+
+    cd master_server
+    python -m benchmarks.simulate --jobs 2000
+    python -m benchmarks.simulate --trace trace.json --policies score,model
+    python -m benchmarks.simulate --export-trace trace.json   # 現在のストアからトレースを保存
+"""
+import sys
+import json
+import time
+import argparse
+import contextlib
+from core.dispatcher import JobDispatcher
+from core.redis_manager import RedisManager
+from benchmarks.simulator import synthetic_trace, export_trace, load_trace, compare_policies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="whisper-orchard dispatch policy simulator")
+    parser.add_argument('--trace', help="トレースJSON (workers / jobs)")
+    parser.add_argument('--export-trace', help="ストア (Redis) の記録からトレースを書き出して終了")
+    parser.add_argument('--jobs', type=int, default=1000, help="合成トレースのジョブ数")
+    parser.add_argument('--workers', default='0.3,0.6,1.2', help="合成トレースのspeed_ratio")
+    parser.add_argument('--slots', help="合成トレースのworker毎スロット数 (例: 1,1,2。省略時は全て1)")
+    parser.add_argument('--interarrival', type=float, default=60.0, help="合成トレースの平均到着間隔 (秒)")
+    parser.add_argument('--policies', default=','.join(JobDispatcher.SELECTION_POLICIES))
+    parser.add_argument('--order', choices=['lpt', 'fifo'], default='lpt', help="ジョブ内のチャンク投入順")
+    parser.add_argument('--overhead', type=float, default=0.0, help="チャンク毎の固定オーバーヘッド (秒)")
+    parser.add_argument('--warm', action='store_true', help="トレースの性能履歴をストアに事前投入")
+    parser.add_argument('--exact-store', action='store_true',
+                        help="高速な代替ストアではなく RedisManager (インメモリ) を使う (遅いが検証用)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help="結果JSONの出力先")
+    args = parser.parse_args(argv)
+
+    if args.export_trace:
+        with contextlib.redirect_stdout(sys.stderr):
+            redis_manager = RedisManager()
+        trace = export_trace(redis_manager)
+        with open(args.export_trace, 'w') as f:
+            json.dump(trace, f, indent=2, ensure_ascii=False)
+        print(f"[Sim] Exported {len(trace['workers'])} workers / {len(trace['jobs'])} jobs to {args.export_trace}")
+        return
+
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        trace = synthetic_trace(
+            n_jobs=args.jobs,
+            speed_ratios=[float(v) for v in args.workers.split(',')],
+            mean_interarrival_sec=args.interarrival,
+            seed=args.seed,
+            slots=[int(v) for v in args.slots.split(',')] if args.slots else None
+        )
+
+    policies = [p.strip() for p in args.policies.split(',') if p.strip()]
+    start = time.perf_counter()
+    results = compare_policies(trace, policies, order=args.order, overhead_sec=args.overhead,
+                               warm=args.warm, seed=args.seed, exact_store=args.exact_store)
+    elapsed = time.perf_counter() - start
+
+    print(f"== {len(trace['jobs'])} jobs / {len(trace['workers'])} workers (order={args.order}) ==")
+    print(f"{'policy':<12}{'makespan':>12}{'util':>8}{'job p50':>10}{'job p95':>10}{'job p99':>10}")
+    for name, r in results.items():
+        if not r.get('finished_jobs'):
+            print(f"{name:<12}{'no finished jobs':>30}")
+            continue
+        print(f"{name:<12}{r['makespan_sec']:>12.1f}{r['utilization_mean']:>8.2f}"
+              f"{r['job_latency_p50_sec']:>10.1f}{r['job_latency_p95_sec']:>10.1f}{r['job_latency_p99_sec']:>10.1f}")
+    print(f"[Sim] {elapsed:.2f}s", file=sys.stderr)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,338 @@
+import json
+import heapq
+import random
+import contextlib
+from collections import deque
+from datetime import datetime
+from core import telemetry
+from core.dispatcher import JobDispatcher
+from core.redis_manager import RedisManager
+
+
+def synthetic_trace(n_jobs=1000, speed_ratios=(0.3, 0.6, 1.2), mean_interarrival_sec=60.0,
+                    mean_job_sec=300.0, seed=0, slots=None):
+    """トレースがない場合用の合成トレース
+    - ジョブ長: 対数正規分布 / チャンク長: 30〜90秒 (splitterのmin_len付近)
+    - worker: speed_ratio を中心に±15%揺らいだ performance_history (スロット単位の速度)
+    - slots: workerごとの同時処理数 (省略時は全て1)
+    - workerの並び順は seed でシャッフルする (各ポリシーは同点時にリスト順で選ぶので、
+      速い順のままだと least_busy 等も常に速いworkerを選び、ポリシー間の差が出ない)
+    """
+    rng = random.Random(seed)
+    slots = list(slots) if slots else [1] * len(speed_ratios)
+    workers = []
+    for i, ratio in enumerate(speed_ratios):
+        history = [{'chunk_duration_sec': 60.0, 'speed_ratio': max(0.01, rng.gauss(ratio, ratio * 0.15))}
+                   for _ in range(20)]
+        workers.append({'url': f"sim://worker{i}", 'slots': slots[i] if i < len(slots) else 1,
+                        'performance_history': history})
+    rng.shuffle(workers)
+
+    jobs = []
+    t = 0.0
+    for _ in range(n_jobs):
+        t += rng.expovariate(1.0 / mean_interarrival_sec)
+        remaining = rng.lognormvariate(0, 0.8) * mean_job_sec / 1.377
+        chunks = []
+        while remaining > 0:
+            d = min(remaining, rng.uniform(30, 90))
+            chunks.append(round(d, 2))
+            remaining -= d
+        jobs.append({'arrival_sec': round(t, 3), 'chunks_sec': chunks})
+    return {'workers': workers, 'jobs': jobs}
+
+
+def export_trace(redis_manager):
+    """ストア上のテレメトリ (直近サンプル) とジョブ記録 (chunks[].duration_sec) からトレースを作る
+    worker:{url} が期限切れでもテレメトリが残っていれば含める (slots は1とみなす)
+    """
+    slots = {w['url']: w.get('slots', 1) for w in redis_manager.get_all_workers()}
+    workers = []
+    for t in redis_manager.get_all_worker_telemetry():
+        record = t['models'].get(t['model']) or {}
+        workers.append({'url': t['url'], 'slots': slots.get(t['url'], 1),
+                        'performance_history': record.get('recent', [])})
+    jobs = []
+    raw_jobs = redis_manager.get_all_jobs(limit=None)
+    if raw_jobs:
+        origin = min(datetime.fromisoformat(j['created_at']) for j in raw_jobs)
+        for job in raw_jobs:
+            chunks = [c['duration_sec'] for c in job.get('chunks', []) if c.get('duration_sec')]
+            if chunks:
+                arrival = (datetime.fromisoformat(job['created_at']) - origin).total_seconds()
+                jobs.append({'arrival_sec': arrival, 'chunks_sec': chunks})
+    jobs.sort(key=lambda j: j['arrival_sec'])
+    return {'workers': workers, 'jobs': jobs}
+
+
+def load_trace(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+class SimWorkerStore:
+    """シミュレータ用のworker state (RedisManager の worker系メソッドと同じ意味をdictで保持)
+
+    JSONのシリアライズを省くための代替で、状態遷移 (スロットの確保/返却で status が変わる等) は
+    RedisManager と揃えてある。検証したい場合は Simulation(exact_store=True) で本物を使う。
+    """
+
+    def __init__(self):
+        self._workers = {}
+        self._telemetry = {}  # url -> {'model': 最後に記録したモデル, 'models': {model: record}}
+
+    def update_worker_status(self, worker_url, status='online', metadata=None, capacity=None):
+        existing = self._workers.get(worker_url, {})
+        capacity = capacity or {}
+        slots_in_use = existing.get('slots_in_use', 0)
+        if status == 'online' and slots_in_use > 0:
+            status = 'busy'
+        self._workers[worker_url] = {
+            'url': worker_url,
+            'status': status,
+            'is_processing': slots_in_use > 0,
+            'slots': max(1, int(capacity.get('slots') or existing.get('slots', 1))),
+            'slots_in_use': slots_in_use,
+            'model': capacity.get('model') or existing.get('model'),
+            'metadata': metadata or {},
+            'pending_chunks': existing.get('pending_chunks', 0),
+            'pending_audio_sec': existing.get('pending_audio_sec', 0)
+        }
+
+    def add_worker(self, worker_url):
+        self.update_worker_status(worker_url, status='online')
+
+    def get_worker_info(self, worker_url):
+        return self._workers.get(worker_url)
+
+    get_worker_status = get_worker_info
+
+    def get_all_workers(self):
+        return list(self._workers.values())
+
+    def mark_worker_offline(self, worker_url):
+        self.update_worker_status(worker_url, status='offline')
+
+    def mark_worker_busy(self, worker_url, job_id):
+        self.update_worker_status(worker_url, status='busy', metadata={'job_id': job_id})
+
+    def mark_worker_idle(self, worker_url):
+        self.update_worker_status(worker_url, status='online')
+
+    def acquire_worker_slot(self, worker_url, job_id=None, audio_sec=0):
+        w = self._workers.get(worker_url)
+        if not w:
+            return False
+        w['slots_in_use'] += 1
+        w['pending_chunks'] += 1
+        w['pending_audio_sec'] += audio_sec
+        w['is_processing'] = True
+        w['status'] = 'busy'
+        w['metadata'] = {'job_id': job_id}
+        return True
+
+    def release_worker_slot(self, worker_url, audio_sec=0, offline=False):
+        w = self._workers.get(worker_url)
+        if not w:
+            return None
+        w['slots_in_use'] = max(0, w['slots_in_use'] - 1)
+        w['pending_chunks'] = max(0, w['pending_chunks'] - 1)
+        w['pending_audio_sec'] = max(0, w['pending_audio_sec'] - audio_sec)
+        w['is_processing'] = w['slots_in_use'] > 0
+        if offline:
+            w['status'] = 'offline'
+        else:
+            w['status'] = 'busy' if w['slots_in_use'] > 0 else 'online'
+        return w
+
+    def increment_worker_pending(self, worker_url, audio_sec=0):
+        w = self._workers.get(worker_url)
+        if w:
+            w['pending_chunks'] += 1
+            w['pending_audio_sec'] += audio_sec
+
+    def decrement_worker_pending(self, worker_url, audio_sec=0):
+        w = self._workers.get(worker_url)
+        if w:
+            w['pending_chunks'] = max(0, w['pending_chunks'] - 1)
+            w['pending_audio_sec'] = max(0, w['pending_audio_sec'] - audio_sec)
+
+    def record_worker_performance(self, worker_url, chunk_duration_sec, processing_time_sec, model=None):
+        if model is None:
+            model = self._workers.get(worker_url, {}).get('model')
+        model = model or 'unknown'
+        entry = self._telemetry.setdefault(worker_url, {'model': None, 'models': {}})
+        record = entry['models'].setdefault(model, telemetry.new_model_record())
+        telemetry.update_model_record(record, chunk_duration_sec, processing_time_sec)
+        entry['model'] = model
+
+    def get_worker_speed_summary(self, worker_url, model=None):
+        entry = self._telemetry.get(worker_url)
+        if not entry:
+            return None
+        record = entry['models'].get(model or entry['model'])
+        return telemetry.summarize(record) if record else None
+
+    def get_worker_avg_speed_ratio(self, worker_url, model=None):
+        summary = self.get_worker_speed_summary(worker_url, model)
+        if not summary or summary.get('ewma_speed') is None:
+            return 1.0
+        return summary['ewma_speed']
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+class Simulation:
+    """離散イベントシミュレータ
+
+    本物の JobDispatcher (acquire_worker / release_worker) をインメモリのストアで動かし、
+    process_job と同じ構造 (ジョブ毎に全スロット数ぶんの並列枠・チャンクは長い順) でトレースを再生する。
+    処理時間 = チャンク長 * (そのworkerの performance_history から復元抽出した speed_ratio) + overhead_sec
+    各workerは slots 件まで同時に処理する。空きスロットがないチャンクはマスター側で到着順に待ち、
+    スロットが返却されるたびに先頭から割り当て直す (acquire_worker の待機と同じ)。
+    """
+
+    def __init__(self, trace, policy='score', order='lpt', overhead_sec=0.0, warm=False, seed=0,
+                 exact_store=False):
+        self.trace = trace
+        self.policy = policy
+        self.order = order
+        self.overhead_sec = overhead_sec
+        self.warm = warm
+        self.seed = seed
+        self.exact_store = exact_store
+
+    def _sample_speed(self, rng, worker):
+        history = worker.get('performance_history') or []
+        if history:
+            return rng.choice(history)['speed_ratio']
+        return worker.get('speed_ratio', 1.0)
+
+    def run(self):
+        rng = random.Random(self.seed)
+        if self.exact_store:
+            with contextlib.redirect_stdout(None):
+                store = RedisManager(use_redis=False)
+        else:
+            store = SimWorkerStore()
+        workers = {w['url']: w for w in self.trace['workers']}
+        for url, w in workers.items():
+            store.add_worker(url)
+            store.update_worker_status(url, 'online', capacity={'slots': w.get('slots', 1)})
+            if self.warm:
+                for h in (w.get('performance_history') or [])[-20:]:
+                    d = h.get('chunk_duration_sec', 60.0)
+                    store.record_worker_performance(url, d, d * h['speed_ratio'])
+        dispatcher = JobDispatcher(list(workers), store, policy=self.policy)
+        slots = {url: max(1, int(w.get('slots', 1))) for url, w in workers.items()}
+        slots_per_job = sum(slots.values())
+
+        events = []  # (time, seq, kind, payload)
+        seq = 0
+
+        def push(t, kind, payload):
+            nonlocal seq
+            heapq.heappush(events, (t, seq, kind, payload))
+            seq += 1
+
+        jobs = []
+        for idx, job in enumerate(self.trace['jobs']):
+            chunks = list(job['chunks_sec'])
+            if self.order == 'lpt':
+                chunks.sort(reverse=True)
+            jobs.append({
+                'id': f"sim-{idx}", 'arrival': job['arrival_sec'], 'queue': deque(chunks),
+                'remaining': len(chunks), 'done_at': None
+            })
+            push(job['arrival_sec'], 'arrival', idx)
+
+        waiting = deque()  # スロット待ちのチャンク (job_idx, duration)
+        busy_time = {url: 0.0 for url in workers}
+        chunk_latencies = []
+        assigned = {url: 0 for url in workers}
+
+        def start(job_idx, duration, now):
+            """空きスロットがあれば即座に処理を開始する。なければ False"""
+            url = dispatcher.acquire_worker(duration, jobs[job_idx]['id'], wait=False)
+            if url is None:
+                return False
+            assigned[url] += 1
+            service = duration * self._sample_speed(rng, workers[url]) + self.overhead_sec
+            busy_time[url] += service
+            push(now + service, 'complete', (url, job_idx, duration, now))
+            return True
+
+        def dispatch(job_idx, now):
+            job = jobs[job_idx]
+            if not job['queue']:
+                return
+            duration = job['queue'].popleft()
+            if waiting or not start(job_idx, duration, now):
+                waiting.append((job_idx, duration))
+
+        def drain(now):
+            while waiting and start(waiting[0][0], waiting[0][1], now):
+                waiting.popleft()
+
+        with contextlib.redirect_stdout(None):
+            now = 0.0
+            while events:
+                now, _, kind, payload = heapq.heappop(events)
+                if kind == 'arrival':
+                    for _ in range(slots_per_job):
+                        dispatch(payload, now)
+                else:
+                    url, job_idx, duration, sent_at = payload
+                    dispatcher.release_worker(url, 'ok', duration, now - sent_at)
+                    chunk_latencies.append(now - sent_at)
+                    job = jobs[job_idx]
+                    job['remaining'] -= 1
+                    if job['remaining'] <= 0:
+                        job['done_at'] = now
+                    drain(now)
+                    dispatch(job_idx, now)
+
+        return self._report(jobs, busy_time, assigned, chunk_latencies, slots)
+
+    def _report(self, jobs, busy_time, assigned, chunk_latencies, slots):
+        finished = [j for j in jobs if j['done_at'] is not None]
+        if not finished:
+            return {'policy': self.policy, 'jobs': len(jobs), 'finished_jobs': 0}
+        start = min(j['arrival'] for j in jobs)
+        end = max(j['done_at'] for j in finished)
+        makespan = end - start
+        job_latencies = [j['done_at'] - j['arrival'] for j in finished]
+        return {
+            'policy': self.policy,
+            'jobs': len(jobs),
+            'finished_jobs': len(finished),
+            'chunks': len(chunk_latencies),
+            'makespan_sec': makespan,
+            # 稼働率はスロット単位 (busy / (slots * makespan))
+            'utilization_mean': sum(busy_time.values()) / (sum(slots.values()) * makespan) if makespan else 0.0,
+            'job_latency_p50_sec': _percentile(job_latencies, 50),
+            'job_latency_p95_sec': _percentile(job_latencies, 95),
+            'job_latency_p99_sec': _percentile(job_latencies, 99),
+            'chunk_latency_p95_sec': _percentile(chunk_latencies, 95),
+            'workers': {
+                url: {
+                    'chunks': assigned[url],
+                    'slots': slots[url],
+                    'utilization': busy_time[url] / (slots[url] * makespan) if makespan else 0.0
+                }
+                for url in busy_time
+            }
+        }
+
+
+def compare_policies(trace, policies=None, **kwargs):
+    policies = policies or list(JobDispatcher.SELECTION_POLICIES)
+    return {p: Simulation(trace, policy=p, **kwargs).run() for p in policies}
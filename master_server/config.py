@@ -1,3 +1,26 @@
 CHUNK_MIN_LENGTH = 30000
 SILENCE_THRESH = -40
-SILENCE_LEN = 700
\ No newline at end of file
+SILENCE_LEN = 700
+# ワーカー選択ポリシー: score / least_busy / lpt / model
+DISPATCH_POLICY = 'score'
+# 同時に実行するジョブ数と待ち行列の上限
+MAX_CONCURRENT_JOBS = 2
+MAX_QUEUED_JOBS = 20
+# 優先度クラス (先頭ほど優先)
+PRIORITY_CLASSES = ['interactive', 'batch']
+DEFAULT_PRIORITY = 'interactive'
+# バッチ投入: 短いファイルを連結する際の無音間隔、1バッチの最大ファイル数、ディレクトリ取込の起点
+BATCH_PACK_GAP_MS = 1000
+BATCH_MAX_FILES = 200
+BATCH_IMPORT_FOLDER = 'imports'
+AUDIO_EXTENSIONS = ['.wav', '.mp3', '.m4a', '.flac', '.ogg', '.aac']
+# Redisが使えない場合のインメモリストアの上限 (UTF-8バイト数。超えたら終了済みジョブからLRUで追い出す)
+MEMORY_STORE_MAX_BYTES = 64 * 1024 * 1024
+# ジョブ毎の作業ディレクトリ (アップロード・チャンク)。SCRATCH_USE_TMPFS=True なら /dev/shm 配下を使う
+SCRATCH_ROOT = 'uploads/jobs'
+SCRATCH_USE_TMPFS = False
+SCRATCH_JOB_QUOTA_BYTES = 2 * 1024 ** 3
+SCRATCH_TOTAL_QUOTA_BYTES = 8 * 1024 ** 3
+# 孤立した作業ディレクトリの回収間隔と猶予
+SCRATCH_SWEEP_INTERVAL_SEC = 60
+SCRATCH_ORPHAN_GRACE_SEC = 300
@@ -0,0 +1,134 @@
+import heapq
+import math
+import time
+import itertools
+import threading
+from core import metrics
+
+
+class AdmissionRejected(Exception):
+    """キューが満杯でジョブを受け付けられない"""
+
+    def __init__(self, message, retry_after_sec):
+        super().__init__(message)
+        self.retry_after_sec = retry_after_sec
+
+
+class AdmissionController:
+    """ジョブの同時実行数を制限し、超過分を優先度付きキューで待たせる
+
+    - 同時に process_job を実行するのは max_concurrent_jobs 件まで
+    - 待ち行列は priority_classes の順 (先頭が最優先)、同じ優先度なら到着順
+    - 待ち行列が max_queued_jobs を超える投入は AdmissionRejected
+    - 待機中ジョブには queue_position / eta_sec をジョブレコードに書き込む
+    """
+
+    def __init__(self, redis_manager, max_concurrent_jobs=2, max_queued_jobs=20,
+                 priority_classes=('interactive', 'batch'), default_job_sec=120.0, on_update=None):
+        self.redis_manager = redis_manager
+        self.max_concurrent_jobs = max(1, max_concurrent_jobs)
+        self.max_queued_jobs = max_queued_jobs
+        self.priority_classes = list(priority_classes)
+        self.on_update = on_update
+        self._lock = threading.Lock()
+        self._queue = []  # (priority_rank, seq, job_id, target, args)
+        self._seq = itertools.count()
+        self._running = {}  # job_id -> started_at
+        # 完了したジョブの実行時間のEWMA (ETA推定用)
+        self._avg_job_sec = default_job_sec
+
+    def validate_priority(self, priority):
+        return priority in self.priority_classes
+
+    def retry_after_sec(self):
+        """最も早く実行枠が空く見込み時間 (Retry-After用)"""
+        with self._lock:
+            return self._retry_after_locked()
+
+    def _retry_after_locked(self):
+        now = time.time()
+        if not self._running:
+            return 1
+        remaining = [max(0.0, self._avg_job_sec - (now - t)) for t in self._running.values()]
+        return max(1, int(math.ceil(min(remaining))))
+
+    def submit(self, job_id, target, args=(), priority='interactive'):
+        """ジョブを投入する。実行枠があれば即座にスレッドを起動し、なければ待ち行列へ"""
+        rank = self.priority_classes.index(priority)
+        with self._lock:
+            if len(self._running) >= self.max_concurrent_jobs and len(self._queue) >= self.max_queued_jobs:
+                raise AdmissionRejected("Job queue is full", self._retry_after_locked())
+            heapq.heappush(self._queue, (rank, next(self._seq), job_id, target, args))
+            started, queued = self._drain_locked()
+        self._publish(started, queued)
+
+    def cancel(self, job_id):
+        """待ち行列からジョブを取り除く。待機中だったら True (実行中/未登録なら False)"""
+        with self._lock:
+            remaining = [entry for entry in self._queue if entry[2] != job_id]
+            if len(remaining) == len(self._queue):
+                return False
+            self._queue = remaining
+            heapq.heapify(self._queue)
+            started, queued = self._drain_locked()
+        self._publish(started, queued)
+        return True
+
+    def _drain_locked(self):
+        """空いた実行枠に待ち行列の先頭を割り当て、待機中ジョブの順番/ETAを書き込む
+        process_job 側の状態更新と競合しないよう、ジョブレコードの更新はロック内で行う
+        """
+        started = []
+        while self._queue and len(self._running) < self.max_concurrent_jobs:
+            _, _, job_id, target, args = heapq.heappop(self._queue)
+            self._running[job_id] = time.time()
+            self.redis_manager.update_job_fields(job_id, queue_position=0, eta_sec=0)
+            started.append(threading.Thread(target=self._run, args=(job_id, target, args), daemon=True))
+
+        queued = [entry[2] for entry in sorted(self._queue)]
+        first_free = self._retry_after_locked() if len(self._running) >= self.max_concurrent_jobs else 0
+        for position, job_id in enumerate(queued, start=1):
+            # 自分より前のジョブが全実行枠を順番に使う前提の概算
+            eta = first_free + math.floor((position - 1) / self.max_concurrent_jobs) * self._avg_job_sec
+            self.redis_manager.update_job_fields(
+                job_id, status='queued', queue_position=position, eta_sec=int(eta)
+            )
+        self._update_gauges_locked()
+        return started, queued
+
+    def _run(self, job_id, target, args):
+        try:
+            target(job_id, *args)
+        finally:
+            with self._lock:
+                started_at = self._running.pop(job_id, None)
+                if started_at is not None:
+                    self._avg_job_sec = 0.8 * self._avg_job_sec + 0.2 * (time.time() - started_at)
+                started, queued = self._drain_locked()
+            self._publish(started, queued)
+
+    def _publish(self, started, queued):
+        """ロック外でスレッドを起動し、待機中ジョブの更新を通知する"""
+        for thread in started:
+            thread.start()
+        if self.on_update:
+            for job_id in queued:
+                self.on_update(job_id)
+
+    def _update_gauges_locked(self):
+        metrics.ADMISSION_RUNNING_JOBS.set(len(self._running))
+        depth = {p: 0 for p in self.priority_classes}
+        for entry in self._queue:
+            depth[self.priority_classes[entry[0]]] += 1
+        for priority, count in depth.items():
+            metrics.ADMISSION_QUEUED_JOBS.set(count, priority=priority)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'running': len(self._running),
+                'queued': len(self._queue),
+                'max_concurrent_jobs': self.max_concurrent_jobs,
+                'max_queued_jobs': self.max_queued_jobs,
+                'avg_job_sec': round(self._avg_job_sec, 1)
+            }
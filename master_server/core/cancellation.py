@@ -0,0 +1,64 @@
+import time
+import threading
+
+# キャンセル済みジョブIDを覚えておく時間 (ジョブのTTLと同じ)
+REMEMBER_SEC = 3600
+
+
+class JobCancelled(Exception):
+    """ジョブがキャンセルされたので処理を打ち切る"""
+
+
+class CancellationRegistry:
+    """キャンセルされたジョブと、そのジョブの応答待ち (in-flight) チャンクを管理する
+
+    dispatcher は /workers/add 等で作り直されるので、状態はこちらに持たせて共有する
+    - cancel(): フラグを立て、応答待ちのチャンクを起こす (process_chunk は応答を待たずに戻る)
+    - check(): 処理の区切りで呼び、キャンセル済みなら JobCancelled
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = {}  # job_id -> cancelled_at
+        self._waiters = {}    # job_id -> set(threading.Event)
+
+    def cancel(self, job_id):
+        now = time.time()
+        with self._lock:
+            for old_id, cancelled_at in list(self._cancelled.items()):
+                if now - cancelled_at > REMEMBER_SEC:
+                    del self._cancelled[old_id]
+            self._cancelled[job_id] = now
+            waiters = list(self._waiters.get(job_id, ()))
+        for event in waiters:
+            event.set()
+
+    def is_cancelled(self, job_id):
+        with self._lock:
+            return job_id in self._cancelled
+
+    def check(self, job_id):
+        if self.is_cancelled(job_id):
+            raise JobCancelled(job_id)
+
+    def watch(self, job_id, event):
+        """応答待ちの間 event を登録する (キャンセル済みなら即座にセット)"""
+        with self._lock:
+            self._waiters.setdefault(job_id, set()).add(event)
+            cancelled = job_id in self._cancelled
+        if cancelled:
+            event.set()
+
+    def unwatch(self, job_id, event):
+        with self._lock:
+            waiters = self._waiters.get(job_id)
+            if waiters is not None:
+                waiters.discard(event)
+                if not waiters:
+                    del self._waiters[job_id]
+
+    def forget(self, job_id):
+        """ジョブの終了時に呼ぶ"""
+        with self._lock:
+            self._cancelled.pop(job_id, None)
+            self._waiters.pop(job_id, None)
@@ -3,12 +3,31 @@ import os
 import json
 import time
 import threading
+from core import metrics
 
 class JobDispatcher:
-    def __init__(self, workers, redis_manager=None):
+    # ワーカー選択ポリシー名 -> メソッド名 (シミュレータからも同じ名前で選択する)
+    SELECTION_POLICIES = {
+        'score': '_get_best_worker_for_chunk',
+        'least_busy': '_get_least_busy_worker',
+        'lpt': '_get_least_loaded_worker',
+        'model': '_get_earliest_finish_worker',
+    }
+
+    def __init__(self, workers, redis_manager=None, policy='score', cancellation=None):
+        if policy not in self.SELECTION_POLICIES:
+            raise ValueError(f"Unknown dispatch policy: {policy}")
         self.workers = workers
         self.redis_manager = redis_manager
+        self.policy = policy
+        # CancellationRegistry (省略時はキャンセル不可)
+        self.cancellation = cancellation
         self._worker_lock = threading.Lock()
+        # スロットが返却されたら待機中のチャンクを起こす
+        self._slot_available = threading.Condition(self._worker_lock)
+        # 再ヘルスチェックは同時に1回だけ (後から来たスレッドはその結果を使う)
+        self._probe_lock = threading.Lock()
+        self._probed_at = 0.0
 
     def get_online_workers(self):
         online = []
@@ -16,22 +35,56 @@ class JobDispatcher:
             try:
                 response = requests.get(f"{worker_url}/", timeout=2)
                 if response.status_code == 200 or response.status_code == 404:
+                    capacity = self._parse_capacity(response)
                     online.append({
                         "id": i + 1,
                         "url": worker_url,
-                        "status": "online"
+                        "status": "online",
+                        "slots": capacity['slots'],
+                        "model": capacity['model']
                     })
                     if self.redis_manager:
-                        self.redis_manager.update_worker_status(worker_url, 'online')
+                        self.redis_manager.update_worker_status(worker_url, 'online', capacity=capacity)
             except:
                 if self.redis_manager:
                     self.redis_manager.mark_worker_offline(worker_url)
         return online
 
-    def _get_least_busy_worker(self):
+    @staticmethod
+    def _parse_capacity(response):
+        """ヘルスチェック応答から同時処理スロット数とモデル名を取得 (旧workerはテキスト応答なので1スロット)"""
+        capacity = {'slots': 1, 'model': None}
+        try:
+            body = response.json()
+            capacity['slots'] = max(1, int(body.get('slots', 1)))
+            capacity['model'] = body.get('model')
+        except Exception:
+            pass
+        return capacity
+
+    @staticmethod
+    def _is_available(worker_info):
+        return bool(worker_info) and worker_info.get('status') != 'offline'
+
+    @staticmethod
+    def _free_slots(worker_info):
+        return worker_info.get('slots', 1) - worker_info.get('slots_in_use', 0)
+
+    def total_slots(self):
+        """登録workerのスロット合計 (ジョブ毎の並列送信数に使う)"""
+        if not self.redis_manager:
+            return max(1, len(self.workers))
+        total = 0
+        for worker_url in self.workers:
+            worker_info = self.redis_manager.get_worker_info(worker_url)
+            total += worker_info.get('slots', 1) if worker_info else 1
+        return max(1, total)
+
+    def _get_least_busy_worker(self, chunk_duration_sec=0):
         """動的に最も負荷の低いworkerを選択
-        1. is_processing=Falseかつonlineのworkerを優先
-        2. 次にpending_chunksが最小のworker
+        1. 空きスロットがあり、何も処理していないworkerを優先
+        2. 次にスロットあたりのpending_chunksが最小のworker
+        空きスロットのあるworkerがいなければ None
         """
         if not self.redis_manager:
             return self.workers[0] if self.workers else None
@@ -41,23 +94,25 @@ class JobDispatcher:
         
         for worker_url in self.workers:
             worker_info = self.redis_manager.get_worker_info(worker_url)
-            if worker_info and worker_info.get('status') == 'online':
-                if not worker_info.get('is_processing', False):
-                    idle_workers.append((worker_url, worker_info.get('pending_chunks', 0)))
-                else:
-                    busy_workers.append((worker_url, worker_info.get('pending_chunks', 0)))
+            if not self._is_available(worker_info) or self._free_slots(worker_info) <= 0:
+                continue
+            load = worker_info.get('pending_chunks', 0) / worker_info.get('slots', 1)
+            if worker_info.get('slots_in_use', 0) == 0:
+                idle_workers.append((worker_url, load))
+            else:
+                busy_workers.append((worker_url, load))
         
         # 待機中workerがあればそこからpending最小を選ぶ
         if idle_workers:
             idle_workers.sort(key=lambda x: x[1])
             return idle_workers[0][0]
         
-        # 全員処理中ならpending最小を選ぶ
+        # 全員処理中なら空きスロットのあるworkerからpending最小を選ぶ
         if busy_workers:
             busy_workers.sort(key=lambda x: x[1])
             return busy_workers[0][0]
         
-        return self.workers[0] if self.workers else None
+        return None
     
     def _get_best_worker_for_chunk(self, chunk_duration_sec):
         """チャンク長とworkerパフォーマンスに基づいて最適workerを選択
@@ -74,22 +129,18 @@ class JobDispatcher:
         
         for worker_url in self.workers:
             worker_info = self.redis_manager.get_worker_info(worker_url)
-            if not worker_info or worker_info.get('status') != 'online':
-                continue
-            
-            is_processing = worker_info.get('is_processing', False)
-            if is_processing:
+            if not self._is_available(worker_info) or self._free_slots(worker_info) <= 0:
                 continue
             
-            performance_history = worker_info.get('performance_history', [])
-            
-            # 性能データがないワーカーは別扱い
-            if not performance_history:
+            # 現在のモデルでの性能データがないワーカーは別扱い
+            speed_summary = self.redis_manager.get_worker_speed_summary(worker_url, worker_info.get('model'))
+            if not speed_summary or not speed_summary.get('samples'):
                 unbenchmarked_workers.append(worker_url)
                 continue
             
-            pending = worker_info.get('pending_chunks', 0)
-            avg_speed = self.redis_manager.get_worker_avg_speed_ratio(worker_url)
+            # 複数スロットのworkerはスロットあたりの負荷で比較
+            pending = worker_info.get('pending_chunks', 0) / worker_info.get('slots', 1)
+            avg_speed = speed_summary['ewma_speed']
             
             # チャンク長を基準に性能を考慮
             if chunk_duration_sec > 60:
@@ -120,20 +171,173 @@ class JobDispatcher:
         print(f"[Dispatcher] Selected {selected_worker} (speed: {speed:.2f}x) for {chunk_duration_sec:.1f}s chunk")
         return selected_worker
 
-    def process_chunk(self, chunk_path, job_id=None, chunk_id=None, chunk_duration_sec=0):
+    def _get_least_loaded_worker(self, chunk_duration_sec=0):
+        """LPT用: 未処理の音声秒数 (pending_audio_sec) が最小のworkerを選択
+        チャンクは process_job 側で長い順に投入されるので、合わせて古典的なLPTになる
+        負荷が同じなら平均speed_ratioの小さい (速い) workerを優先する (登録順に依存させない)
+        """
+        if not self.redis_manager:
+            return self.workers[0] if self.workers else None
+        best = None
+        for worker_url in self.workers:
+            worker_info = self.redis_manager.get_worker_info(worker_url)
+            if not self._is_available(worker_info) or self._free_slots(worker_info) <= 0:
+                continue
+            load = worker_info.get('pending_audio_sec', 0) / worker_info.get('slots', 1)
+            if best is not None and load > best[1]:
+                continue
+            avg_speed = self.redis_manager.get_worker_avg_speed_ratio(worker_url, worker_info.get('model'))
+            if best is None or (load, avg_speed) < best[1:]:
+                best = (worker_url, load, avg_speed)
+        return best[0] if best else None
+
+    def _get_earliest_finish_worker(self, chunk_duration_sec=0):
+        """モデルベース: (スロットあたりの未処理音声秒 + チャンク長) * 平均speed_ratio で完了予想時刻が最小のworkerを選択
+        speed_ratio はスロット単位で計測されるので、スロット数とスループットに比例して割り振られる
+        性能データがないworkerは speed_ratio=1.0 とみなす
+        """
+        if not self.redis_manager:
+            return self.workers[0] if self.workers else None
+        best = None
+        for worker_url in self.workers:
+            worker_info = self.redis_manager.get_worker_info(worker_url)
+            if not self._is_available(worker_info) or self._free_slots(worker_info) <= 0:
+                continue
+            avg_speed = self.redis_manager.get_worker_avg_speed_ratio(worker_url, worker_info.get('model'))
+            load = worker_info.get('pending_audio_sec', 0) / worker_info.get('slots', 1)
+            eta = (load + chunk_duration_sec) * avg_speed
+            if best is None or eta < best[1]:
+                best = (worker_url, eta)
+        return best[0] if best else None
+
+    def _select_worker(self, chunk_duration_sec):
+        return getattr(self, self.SELECTION_POLICIES[self.policy])(chunk_duration_sec)
+
+    def _is_cancelled(self, job_id):
+        return bool(self.cancellation and job_id and self.cancellation.is_cancelled(job_id))
 
-        # ワーカー選択と is_processing 設定を排他的に実行
-        with self._worker_lock:
-            worker_url = self._get_best_worker_for_chunk(chunk_duration_sec)
-            if not worker_url:
+    def _has_live_worker(self):
+        if not self.redis_manager:
+            return bool(self.workers)
+        return any(self._is_available(self.redis_manager.get_worker_info(url)) for url in self.workers)
+
+    def acquire_worker(self, chunk_duration_sec=0, job_id=None, wait=True):
+        """空きスロットのあるワーカーを選択し、スロットを確保する (選択と確保は排他的に実行)
+        全スロットが埋まっていれば返却を待つ (wait=False なら None を返す)
+        オンラインのworkerが1台もいなければ (worker:{url} の期限切れ・接続失敗による offline を含む)
+        ヘルスチェックをやり直し、それでもいなければ None
+        """
+        probed = False
+        while True:
+            with self._slot_available:
+                while True:
+                    if self._is_cancelled(job_id):
+                        return None
+                    worker_url = self._select_worker(chunk_duration_sec)
+                    if worker_url:
+                        if self.redis_manager:
+                            self.redis_manager.acquire_worker_slot(worker_url, job_id, audio_sec=chunk_duration_sec)
+                        return worker_url
+                    if not self._has_live_worker():
+                        break
+                    if not wait:
+                        return None
+                    # 他プロセスによるstate変化も拾えるよう定期的に再評価する
+                    self._slot_available.wait(timeout=1.0)
+            if probed or not self.workers:
                 print("[Dispatcher] No available worker!")
                 return None
-            
-            # 即座に is_processing を True に設定
-            if self.redis_manager:
-                self.redis_manager.set_worker_processing(worker_url, True)
-                self.redis_manager.mark_worker_busy(worker_url, job_id)
-                self.redis_manager.increment_worker_pending(worker_url)
+            # HTTPを伴うのでロックの外で行う (オンラインに戻ったworkerは state が作り直される)
+            found_at = time.time()
+            with self._probe_lock:
+                if self._probed_at < found_at:
+                    print("[Dispatcher] No live worker in state, re-probing workers...")
+                    self.get_online_workers()
+                    self._probed_at = time.time()
+            probed = True
+
+    def release_worker(self, worker_url, outcome='ok', chunk_duration_sec=0, processing_time_sec=None):
+        """acquire_worker で確保したスロットを返却する
+        outcome: 'ok' (性能を記録) / 'error' / 'offline' (接続失敗) / 'cancelled' (放棄した要求が終わった)
+        """
+        if not self.redis_manager:
+            return
+        with self._slot_available:
+            worker_info = self.redis_manager.release_worker_slot(
+                worker_url, audio_sec=chunk_duration_sec, offline=(outcome == 'offline')
+            )
+            self._slot_available.notify_all()
+        # チャンク長が不明 (0) なら速度比が出せないので記録しない
+        if outcome == 'ok' and processing_time_sec is not None and chunk_duration_sec > 0:
+            # 返却時に読んだ state のモデル名を使い、worker:{url} の再読込を省く
+            model = (worker_info.get('model') or 'unknown') if worker_info else None
+            self.redis_manager.record_worker_performance(worker_url, chunk_duration_sec, processing_time_sec, model=model)
+
+    def _post_chunk(self, endpoint, chunk_path, params):
+        with open(chunk_path, 'rb') as f:
+            headers = {'Content-Type': 'audio/wav'}
+            return requests.post(
+                endpoint, 
+                data=f, 
+                headers=headers, 
+                params=params,
+                timeout=600000
+            )
+
+    def _post_chunk_cancellable(self, endpoint, chunk_path, params, job_id, on_abandoned=None):
+        """ジョブがキャンセルされたら応答を待たずに None を返す
+        送信スレッドはworkerの応答まで残り、結果は捨てて on_abandoned(outcome) を呼ぶ
+        (worker側の推論は止められないので、スロットの返却はそこで行う)
+        outcome は接続失敗なら 'offline'、それ以外は 'cancelled' (release_worker の outcome と同じ)
+        送信前にキャンセル済みなら送らずに on_abandoned('cancelled') を呼ぶ
+        """
+        if not (self.cancellation and job_id):
+            return self._post_chunk(endpoint, chunk_path, params)
+        outcome = {}
+        done = threading.Event()
+        # 応答と放棄のどちらが先かを決める (片方だけが後始末する)
+        state_lock = threading.Lock()
+        state = {'finished': False, 'abandoned': False}
+
+        def _send():
+            try:
+                outcome['response'] = self._post_chunk(endpoint, chunk_path, params)
+            except Exception as e:
+                outcome['error'] = e
+            finally:
+                with state_lock:
+                    state['finished'] = True
+                    abandoned = state['abandoned']
+                done.set()
+                if abandoned and on_abandoned:
+                    on_abandoned('offline' if 'error' in outcome else 'cancelled')
+
+        self.cancellation.watch(job_id, done)
+        try:
+            if done.is_set():
+                # スロット確保後・送信前にキャンセルされた: worker には送らず、スロットもすぐ返す
+                if on_abandoned:
+                    on_abandoned('cancelled')
+                return None
+            threading.Thread(target=_send, daemon=True).start()
+            done.wait()
+        finally:
+            self.cancellation.unwatch(job_id, done)
+        with state_lock:
+            if not state['finished']:
+                state['abandoned'] = True
+                return None
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome.get('response')
+
+    def process_chunk(self, chunk_path, job_id=None, chunk_id=None, chunk_duration_sec=0, queue_wait_sec=None):
+
+        if self._is_cancelled(job_id):
+            return None
+        worker_url = self.acquire_worker(chunk_duration_sec, job_id)
+        if not worker_url:
+            return None
             
         endpoint = f"{worker_url}/transcribe"
         params = {"include_formatted_log": "false"}
@@ -141,53 +345,74 @@ class JobDispatcher:
         print(f"[Dispatcher] Sending {os.path.basename(chunk_path)} ({chunk_duration_sec:.1f}s) to {worker_url}...")
         
         if self.redis_manager and job_id and chunk_id:
-            self.redis_manager.add_chunk_to_job(job_id, chunk_id, worker_url)
+            self.redis_manager.add_chunk_to_job(job_id, chunk_id, worker_url, duration_sec=chunk_duration_sec)
         
+        def _release_abandoned(outcome):
+            # 放棄した要求を worker が終えた (または送らなかった) ので、ここでスロットを返す (処理時間は記録しない)
+            # 接続失敗で終わった場合はキャンセルでない場合と同じく offline にする
+            print(f"[Dispatcher] Releasing slot on {worker_url} held by cancelled job ({outcome})")
+            self.release_worker(worker_url, outcome, chunk_duration_sec)
+
         start_time = time.time()
+        metrics.CHUNKS_IN_FLIGHT.inc()
         try:
-            with open(chunk_path, 'rb') as f:
-                headers = {'Content-Type': 'audio/wav'}
-                response = requests.post(
-                    endpoint, 
-                    data=f, 
-                    headers=headers, 
-                    params=params,
-                    timeout=600000
-                )
+            # 送信だけを接続失敗として扱う (成功後の後処理の例外でスロットを二重に返却しない)
+            try:
+                response = self._post_chunk_cancellable(endpoint, chunk_path, params, job_id,
+                                                        on_abandoned=_release_abandoned)
+            except Exception as e:
+                print(f"[Dispatcher] Connection failed: {e}")
+                metrics.WORKER_REQUESTS_TOTAL.inc(worker=worker_url, result='connection_failed')
+                self.release_worker(worker_url, 'offline', chunk_duration_sec)
+                return None
+            if response is None:
+                # キャンセルで放棄: ジョブは待たずに戻る。worker はまだ推論中なので、
+                # スロットは送信スレッドが応答を受けるまで確保したまま (後続チャンクが後ろに並んで性能記録を歪めない)
+                print(f"[Dispatcher] Abandoned {os.path.basename(chunk_path)} on {worker_url} (job cancelled)")
+                metrics.WORKER_REQUESTS_TOTAL.inc(worker=worker_url, result='cancelled')
+                return None
             processing_time_sec = time.time() - start_time
+            metrics.WORKER_REQUEST_SECONDS.observe(processing_time_sec, worker=worker_url)
             
-            if self.redis_manager:
-                self.redis_manager.set_worker_processing(worker_url, False)
-            
-            if response.status_code == 200:
-                result = response.json()
-                
-                if self.redis_manager and job_id and chunk_id:
-                    self.redis_manager.complete_chunk(job_id, chunk_id, result)
-                    self.redis_manager.mark_worker_idle(worker_url)
-                    # pending_chunksをデクリメント
-                    self.redis_manager.decrement_worker_pending(worker_url)
-                    # パフォーマンス記録
-                    self.redis_manager.record_worker_performance(worker_url, chunk_duration_sec, processing_time_sec)
-                
-                print(f"[Dispatcher] {worker_url} completed in {processing_time_sec:.1f}s (speed: {processing_time_sec/chunk_duration_sec:.2f}x)")
-                return result
-            else:
+            if response.status_code != 200:
                 print(f"[Dispatcher] Error from worker: {response.status_code} - {response.text}")
-                
-                if self.redis_manager:
-                    self.redis_manager.set_worker_processing(worker_url, False)
-                    self.redis_manager.mark_worker_idle(worker_url)
-                    self.redis_manager.decrement_worker_pending(worker_url)
-                
+                metrics.WORKER_REQUESTS_TOTAL.inc(worker=worker_url, result='error')
+                self.release_worker(worker_url, 'error', chunk_duration_sec)
+                return None
+            try:
+                result = response.json()
+            except ValueError as e:
+                print(f"[Dispatcher] Invalid response from {worker_url}: {e}")
+                metrics.WORKER_REQUESTS_TOTAL.inc(worker=worker_url, result='error')
+                self.release_worker(worker_url, 'error', chunk_duration_sec)
                 return None
+
+            speed_ratio = processing_time_sec / chunk_duration_sec if chunk_duration_sec > 0 else None
+            try:
+                # ワーカー申告の推論時間と往復時間の差を転送時間とみなす
+                compute_sec = result.get('time_ms', 0) / 1000.0
+                transfer_sec = max(0.0, processing_time_sec - compute_sec)
+                metrics.WORKER_COMPUTE_SECONDS.observe(compute_sec, worker=worker_url)
+                metrics.WORKER_TRANSFER_SECONDS.observe(transfer_sec, worker=worker_url)
+                metrics.WORKER_REQUESTS_TOTAL.inc(worker=worker_url, result='ok')
+                if speed_ratio is not None:
+                    metrics.WORKER_SPEED_RATIO.set(speed_ratio, worker=worker_url)
                 
-        except Exception as e:
-            print(f"[Dispatcher] Connection failed: {e}")
-            
-            if self.redis_manager:
-                self.redis_manager.set_worker_processing(worker_url, False)
-                self.redis_manager.mark_worker_offline(worker_url)
-                self.redis_manager.decrement_worker_pending(worker_url)
+                if self.redis_manager and job_id and chunk_id:
+                    timings = {
+                        'request_ms': int(processing_time_sec * 1000),
+                        'compute_ms': int(compute_sec * 1000),
+                        'transfer_ms': int(transfer_sec * 1000)
+                    }
+                    if queue_wait_sec is not None:
+                        timings['queue_wait_ms'] = int(queue_wait_sec * 1000)
+                    self.redis_manager.complete_chunk(job_id, chunk_id, result, timings=timings)
+            finally:
+                # idleに戻し、pending_chunksのデクリメントとパフォーマンス記録 (後処理が失敗しても1回だけ)
+                self.release_worker(worker_url, 'ok', chunk_duration_sec, processing_time_sec)
             
-            return None
\ No newline at end of file
+            speed = f"{speed_ratio:.2f}x" if speed_ratio is not None else "n/a"
+            print(f"[Dispatcher] {worker_url} completed in {processing_time_sec:.1f}s (speed: {speed})")
+            return result
+        finally:
+            metrics.CHUNKS_IN_FLIGHT.dec()
@@ -0,0 +1,166 @@
+import time
+import heapq
+import fnmatch
+import threading
+from collections import OrderedDict
+from core import metrics
+
+# 既定の上限 (キー + 値の UTF-8 バイト数の合計)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# 書き込み何回ごとに期限切れキーを掃除するか
+SWEEP_EVERY = 256
+
+
+def _namespace(key):
+    """'job:abc' -> 'job:' (':' を含まないキーは '')"""
+    i = key.find(':')
+    return key[:i + 1] if i >= 0 else ''
+
+
+def _size(key, value):
+    """キー + 値の UTF-8 バイト数 (json.dumps の出力は通常 ASCII なので encode を省ける)"""
+    size = len(key) if key.isascii() else len(key.encode('utf-8'))
+    if isinstance(value, bytes):
+        return size + len(value)
+    value = str(value)
+    return size + (len(value) if value.isascii() else len(value.encode('utf-8')))
+
+
+class MemoryStore:
+    """Redis が使えない場合の単一プロセス用ストア (get / set / delete / keys / update)
+
+    - TTL: set(ex=) の期限を守る。読み出し時と定期的な掃除で削除
+    - 上限: max_bytes を超えたら最も長く使われていないキーから追い出す (LRU)
+      TTL付きのキーを先に、TTLなしのキーは後に追い出す。pinned(key, value) が True のキー
+      (worker / テレメトリ / 実行中ジョブ等) は追い出さない (それだけで上限を超える間は超過を許す)
+    - keys('job:*') のような前方一致は名前空間ごとの索引で引く (それ以外は fnmatch で全走査)
+    - update(key, fn): キー単位のロック (ストライプ) 内で読み出し→変更→書き込みを行う
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, stripes=16, pinned=None):
+        self.max_bytes = max_bytes
+        self.pinned = pinned
+        self._lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self._data = OrderedDict()  # key -> (value, expires_at, size, pinned)
+        self._index = {}            # namespace -> set(key)
+        self._expiry = []           # (expires_at, key) のヒープ (上書きされた古い項目は掃除時に無視)
+        self._bytes = 0
+        self._writes = 0
+
+    def _stripe(self, key):
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    # --- 以下 _lock 保持中に呼ぶ ---
+
+    def _remove_locked(self, key, reason=None):
+        _, _, size, _ = self._data.pop(key)
+        self._bytes -= size
+        keys = self._index.get(_namespace(key))
+        if keys is not None:
+            keys.discard(key)
+        if reason:
+            metrics.STORE_EVICTIONS_TOTAL.inc(reason=reason)
+
+    def _alive_locked(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= now:
+            self._remove_locked(key, 'ttl')
+            return None
+        return entry
+
+    def _sweep_locked(self, now):
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(self._expiry)
+            entry = self._data.get(key)
+            if entry is not None and entry[1] == expires_at:
+                self._remove_locked(key, 'ttl')
+
+    def _evict_locked(self, written_key):
+        """追い出すキーを選ぶ: TTL付きの最古 > TTLなしの最古 (pinned と書き込んだばかりのキーは対象外)"""
+        fallback = None
+        for key, entry in self._data.items():
+            if entry[3] or key == written_key:
+                continue
+            if entry[1] is not None:
+                return key
+            if fallback is None:
+                fallback = key
+        return fallback
+
+    def _set_locked(self, key, value, ex, pinned):
+        now = time.time()
+        if key in self._data:
+            self._remove_locked(key)
+        expires_at = now + ex if ex else None
+        size = _size(key, value)
+        self._data[key] = (value, expires_at, size, pinned)
+        self._bytes += size
+        self._index.setdefault(_namespace(key), set()).add(key)
+        if expires_at is not None:
+            heapq.heappush(self._expiry, (expires_at, key))
+            if len(self._expiry) > 2 * len(self._data) + SWEEP_EVERY:
+                # 上書きで無効になった項目が溜まったら作り直す
+                self._expiry = [(e[1], k) for k, e in self._data.items() if e[1] is not None]
+                heapq.heapify(self._expiry)
+        self._writes += 1
+        if self._writes % SWEEP_EVERY == 0:
+            self._sweep_locked(now)
+        while self._bytes > self.max_bytes:
+            victim = self._evict_locked(key)
+            if victim is None:
+                break
+            self._remove_locked(victim, 'lru')
+
+    # --- 公開API (redis.Redis と同じ引数) ---
+
+    def get(self, key):
+        with self._lock:
+            entry = self._alive_locked(key, time.time())
+            if entry is None:
+                return None
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def _is_pinned(self, key, value):
+        return bool(self.pinned and self.pinned(key, value))
+
+    def set(self, key, value, ex=None):
+        pinned = self._is_pinned(key, value)
+        with self._stripe(key):
+            with self._lock:
+                self._set_locked(key, value, ex, pinned)
+
+    def delete(self, key):
+        with self._stripe(key):
+            with self._lock:
+                if key in self._data:
+                    self._remove_locked(key)
+
+    def keys(self, pattern='*'):
+        now = time.time()
+        prefix = pattern[:-1] if pattern.endswith('*') else None
+        with self._lock:
+            if prefix and _namespace(prefix) and not any(c in prefix for c in '*?['):
+                candidates = [k for k in self._index.get(_namespace(prefix), ()) if k.startswith(prefix)]
+            else:
+                candidates = [k for k in self._data if fnmatch.fnmatchcase(k, pattern)]
+            return [k for k in candidates if self._alive_locked(k, now) is not None]
+
+    def update(self, key, fn, ex=None):
+        """fn(現在値 or None) の戻り値を書き込む (None なら書き込まない)。書き込んだ値を返す
+        同じキーへの set / delete / update とは排他になる
+        """
+        with self._stripe(key):
+            value = fn(self.get(key))
+            if value is not None:
+                pinned = self._is_pinned(key, value)
+                with self._lock:
+                    self._set_locked(key, value, ex, pinned)
+            return value
+
+    def info(self):
+        with self._lock:
+            return {'keys': len(self._data), 'bytes': self._bytes, 'max_bytes': self.max_bytes}
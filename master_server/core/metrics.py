@@ -0,0 +1,212 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# 秒単位の既定バケット (Redis操作〜チャンク推論まで)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = [f'{k}="{_escape(v)}"' for k, v in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [バケット毎の件数..., +Inf], 合計, 件数
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][idx] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_sample(self, key, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, c in zip(self.buckets + (float('inf'),), counts):
+            cumulative += c
+            labels = _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        base = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{base} {_format_value(total)}")
+        lines.append(f"{self.name}_count{base} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, fn):
+        """/metrics 取得時に呼ばれるコールバック (キュー長などスクレイプ時に集計する値用)"""
+        self._collectors.append(fn)
+
+    def render(self):
+        for fn in self._collectors:
+            try:
+                fn()
+            except Exception as e:
+                print(f"[Metrics] Collector failed: {e}")
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+JOB_STAGE_SECONDS = REGISTRY.register(Histogram(
+    'orchard_job_stage_seconds', 'Time spent per job stage', ['stage']))
+CHUNK_QUEUE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'orchard_chunk_queue_wait_seconds', 'Time a chunk waited in the job executor before dispatch'))
+WORKER_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'orchard_worker_request_seconds', 'Round-trip time of /transcribe requests', ['worker']))
+WORKER_COMPUTE_SECONDS = REGISTRY.register(Histogram(
+    'orchard_worker_compute_seconds', 'Inference time reported by the worker (time_ms)', ['worker']))
+WORKER_TRANSFER_SECONDS = REGISTRY.register(Histogram(
+    'orchard_worker_transfer_seconds', 'Round-trip time minus reported inference time', ['worker']))
+WORKER_SPEED_RATIO = REGISTRY.register(Gauge(
+    'orchard_worker_speed_ratio', 'Last measured processing_time / audio_duration', ['worker']))
+WORKER_PENDING_CHUNKS = REGISTRY.register(Gauge(
+    'orchard_worker_pending_chunks', 'pending_chunks recorded in the worker state', ['worker']))
+WORKER_SLOTS = REGISTRY.register(Gauge(
+    'orchard_worker_slots', 'Concurrent transcription slots advertised by the worker', ['worker']))
+WORKER_SLOTS_IN_USE = REGISTRY.register(Gauge(
+    'orchard_worker_slots_in_use', 'Slots currently held by in-flight chunks', ['worker']))
+WORKER_REQUESTS_TOTAL = REGISTRY.register(Counter(
+    'orchard_worker_requests_total', 'Chunk requests sent to workers', ['worker', 'result']))
+CHUNKS_IN_FLIGHT = REGISTRY.register(Gauge(
+    'orchard_chunks_in_flight', 'Chunks currently sent to a worker and awaiting a response'))
+JOBS_BY_STATUS = REGISTRY.register(Gauge(
+    'orchard_jobs', 'Jobs in the store by status', ['status']))
+STORE_OP_SECONDS = REGISTRY.register(Histogram(
+    'orchard_store_op_seconds', 'Latency of state store operations', ['op', 'backend']))
+STORE_EVICTIONS_TOTAL = REGISTRY.register(Counter(
+    'orchard_store_evictions_total', 'Keys removed by the in-memory store', ['reason']))
+STORE_MEMORY_BYTES = REGISTRY.register(Gauge(
+    'orchard_store_memory_bytes', 'Size of keys and values held by the in-memory store'))
+SCRATCH_USED_BYTES = REGISTRY.register(Gauge(
+    'orchard_scratch_used_bytes', 'Bytes held in per-job scratch workspaces'))
+SCRATCH_WORKSPACES = REGISTRY.register(Gauge(
+    'orchard_scratch_workspaces', 'Per-job scratch workspaces currently allocated'))
+SCRATCH_DEVICE_FREE_BYTES = REGISTRY.register(Gauge(
+    'orchard_scratch_device_free_bytes', 'Free bytes on the device holding the scratch root'))
+SCRATCH_RECLAIMED_BYTES_TOTAL = REGISTRY.register(Counter(
+    'orchard_scratch_reclaimed_bytes_total', 'Bytes removed from orphaned scratch workspaces'))
+ADMISSION_RUNNING_JOBS = REGISTRY.register(Gauge(
+    'orchard_admission_running_jobs', 'Jobs admitted and currently running'))
+ADMISSION_QUEUED_JOBS = REGISTRY.register(Gauge(
+    'orchard_admission_queued_jobs', 'Jobs waiting for admission', ['priority']))
+ADMISSION_REJECTED_TOTAL = REGISTRY.register(Counter(
+    'orchard_admission_rejected_total', 'Submissions rejected because the queue was full', ['priority']))
+JOBS_CANCELLED_TOTAL = REGISTRY.register(Counter(
+    'orchard_jobs_cancelled_total', 'Jobs cancelled by users', ['state']))
+
+
+def render_metrics():
+    return REGISTRY.render()
+
+
+def record_stage(redis_manager, job_id, stage, duration, started_at=None):
+    """計測済みのステージ時間を記録する (splitter内部の decode/detect/export など)"""
+    JOB_STAGE_SECONDS.observe(duration, stage=stage)
+    if redis_manager and job_id:
+        redis_manager.record_job_stage(job_id, stage, duration, started_at=started_at)
+
+
+@contextmanager
+def job_stage(redis_manager, job_id, stage):
+    """ジョブのステージ所要時間をヒストグラムとジョブレコード (stages) の両方に記録する"""
+    started_at = time.time()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(redis_manager, job_id, stage, time.perf_counter() - start, started_at=started_at)
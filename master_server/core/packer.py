@@ -0,0 +1,123 @@
+import os
+from pydub import AudioSegment
+from core.splitter import split_audio
+from core.aggregator import _format_timestamp
+
+
+def pack_files(file_paths, output_dir, unit_prefix, min_len=30000, gap_ms=1000, silence_thresh=None):
+    """複数ファイルをディスパッチ単位 (unit) にまとめる
+
+    - min_len 未満の短いファイルは、間に gap_ms の無音を挟んで連結し min_len 付近の unit にまとめる
+    - min_len 以上のファイルは split_audio で通常通り分割し、各チャンクを1 unit とする
+      (チャンク内の無音を除いて連結された区間ごとに span を作る)
+    各 unit は spans に「unit内のどこが、どのファイルのどの位置か」を持つ:
+        {'file_index', 'unit_offset_ms', 'file_offset_ms', 'length_ms'}
+    """
+    units = []
+    pending = None  # 連結中の unit: {'audio', 'spans'}
+
+    def _flush():
+        nonlocal pending
+        if pending:
+            path = os.path.join(output_dir, f"{unit_prefix}_unit{len(units):03d}.wav")
+            pending['audio'].export(path, format="wav")
+            units.append({'path': path, 'duration_ms': len(pending['audio']), 'spans': pending['spans']})
+            pending = None
+
+    for file_index, file_path in enumerate(file_paths):
+        audio = AudioSegment.from_file(file_path).set_frame_rate(16000).set_channels(1)
+        if len(audio) >= min_len:
+            # 長いファイルは単独で分割 (連結中のunitはそのまま次の短いファイルを待つ)
+            sources = []
+            chunk_paths = split_audio(
+                file_path, output_dir, min_len=min_len, silence_thresh=silence_thresh, sources=sources
+            )
+            for chunk_path, pieces in zip(chunk_paths, sources):
+                # 同名ファイルのチャンク衝突を避けるため unit 名に付け替える
+                path = os.path.join(output_dir, f"{unit_prefix}_unit{len(units):03d}.wav")
+                os.replace(chunk_path, path)
+                # チャンクは無音を除いた区間の連結なので、区間毎に元ファイル上の位置を持たせる
+                spans = []
+                unit_offset = 0
+                for piece in pieces:
+                    spans.append({
+                        'file_index': file_index, 'unit_offset_ms': unit_offset,
+                        'file_offset_ms': piece['source_offset_ms'], 'length_ms': piece['length_ms']
+                    })
+                    unit_offset += piece['length_ms']
+                units.append({'path': path, 'duration_ms': unit_offset, 'spans': spans})
+            continue
+
+        if pending is None:
+            pending = {'audio': audio, 'spans': []}
+            offset = 0
+        else:
+            pending['audio'] += AudioSegment.silent(duration=gap_ms, frame_rate=16000)
+            offset = len(pending['audio'])
+            pending['audio'] += audio
+        pending['spans'].append({
+            'file_index': file_index, 'unit_offset_ms': offset,
+            'file_offset_ms': 0, 'length_ms': len(audio)
+        })
+        if len(pending['audio']) >= min_len:
+            _flush()
+
+    _flush()
+    return units
+
+
+def _find_span(spans, t_ms):
+    """t_ms を含む span (なければ最も近い span) を返す"""
+    best = None
+    best_dist = None
+    for span in spans:
+        start = span['unit_offset_ms']
+        end = start + span['length_ms']
+        if start <= t_ms < end:
+            return span
+        dist = start - t_ms if t_ms < start else t_ms - end
+        if best is None or dist < best_dist:
+            best, best_dist = span, dist
+    return best
+
+
+def unpack_results(units, results, file_names):
+    """unit毎のworker結果をファイル毎の結果に戻す (タイムスタンプはファイル先頭基準)"""
+    files = [{'filename': name, 'segments': [], 'processing_time_ms': 0} for name in file_names]
+    for unit, res in zip(units, results):
+        if not res:
+            continue
+        spans = unit['spans']
+        total_len = sum(s['length_ms'] for s in spans) or 1
+        for span in spans:
+            # unit全体の処理時間を音声長で按分
+            files[span['file_index']]['processing_time_ms'] += int(res.get('time_ms', 0) * span['length_ms'] / total_len)
+        for seg in res.get('segments', []):
+            start_ms = seg.get('start_ms', 0)
+            end_ms = seg.get('end_ms', 0)
+            # セグメント中点でどのファイルに属するか判定
+            span = _find_span(spans, (start_ms + end_ms) / 2)
+            shift = span['file_offset_ms'] - span['unit_offset_ms']
+            # gap を跨いだ分はファイル範囲内に収める
+            lo = span['file_offset_ms']
+            hi = span['file_offset_ms'] + span['length_ms']
+            s = min(max(start_ms + shift, lo), hi)
+            e = min(max(end_ms + shift, lo), hi)
+            files[span['file_index']]['segments'].append({
+                'start': _format_timestamp(s),
+                'end': _format_timestamp(e),
+                'start_ms': s,
+                'end_ms': e,
+                'text': seg.get('text', '')
+            })
+
+    for f in files:
+        f['segments'].sort(key=lambda seg: seg['start_ms'])
+        f['text'] = "\n".join(seg['text'].strip() for seg in f['segments'] if seg['text'].strip())
+        f['segments_count'] = len(f['segments'])
+    return {
+        "text": "\n\n".join(f"[{f['filename']}]\n{f['text']}" for f in files),
+        "total_processing_time_ms": sum(f['processing_time_ms'] for f in files),
+        "files_count": len(files),
+        "files": files
+    }
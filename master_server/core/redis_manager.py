@@ -1,73 +1,168 @@
 import redis
 import json
 import time
+import uuid
 from datetime import datetime, timedelta
+from core.metrics import STORE_OP_SECONDS
+from core.memory_store import MemoryStore, DEFAULT_MAX_BYTES
+from core import telemetry
+
+# インメモリ時に上限を超えても追い出さないキー (TTLなしの性能記録、worker state、ユーザー設定)
+PINNED_PREFIXES = ('worker:', 'telemetry:', 'telemetry_detail:', 'user_pref:')
+FINISHED_JOB_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+def _is_pinned(key, value):
+    """MemoryStore の追い出し対象外か。ジョブは終了したものだけを追い出せる"""
+    if key.startswith(PINNED_PREFIXES):
+        return True
+    if key.startswith('job:'):
+        try:
+            return json.loads(value).get('status') not in FINISHED_JOB_STATUSES
+        except (ValueError, AttributeError):
+            return False
+    return False
+
 
 class RedisManager:
+    """ジョブ/worker state のストア。_backend は redis.Redis か MemoryStore (どちらも get/set/delete/keys)"""
 
-    def __init__(self, host='localhost', port=6379, db=0):
+    def __init__(self, host='localhost', port=6379, db=0, use_redis=True, memory_max_bytes=DEFAULT_MAX_BYTES):
 
-        self.use_redis = True
+        # worker state のスロット確保 (lease) の持ち主。再起動前のプロセスの lease はヘルスチェックで回収する
+        self.owner_id = uuid.uuid4().hex[:12]
+        self.use_redis = use_redis
+        if not use_redis:
+            print("[Redis] In-memory mode (Redis disabled)")
+            self._backend = MemoryStore(max_bytes=memory_max_bytes, pinned=_is_pinned)
+            return
         try:
-            self.redis = redis.Redis(host=host, port=port, db=db, decode_responses=True)
-            self.redis.ping()
+            self._backend = redis.Redis(host=host, port=port, db=db, decode_responses=True)
+            self._backend.ping()
             print("[Redis] Connected successfully")
         except Exception as e:
             print(f"[Redis] Connection failed: {e}")
             print("[Redis] Fallback to in-memory mode")
             self.use_redis = False
-            self._memory_store = {}
+            self._backend = MemoryStore(max_bytes=memory_max_bytes, pinned=_is_pinned)
     
+    def _observe_op(self, op, start):
+        STORE_OP_SECONDS.observe(time.perf_counter() - start, op=op,
+                                 backend='redis' if self.use_redis else 'memory')
+
     def _set(self, key, value, ex=None):
-        if self.use_redis:
-            self.redis.set(key, value, ex=ex)
-        else:
-            self._memory_store[key] = value
+        start = time.perf_counter()
+        self._backend.set(key, value, ex=ex)
+        self._observe_op('set', start)
     
     def _get(self, key):
-        if self.use_redis:
-            return self.redis.get(key)
-        else:
-            return self._memory_store.get(key)
+        start = time.perf_counter()
+        value = self._backend.get(key)
+        self._observe_op('get', start)
+        return value
     
     def _delete(self, key):
-        if self.use_redis:
-            self.redis.delete(key)
-        else:
-            self._memory_store.pop(key, None)
+        start = time.perf_counter()
+        self._backend.delete(key)
+        self._observe_op('delete', start)
     
     def _keys(self, pattern):
-        if self.use_redis:
-            return self.redis.keys(pattern)
+        start = time.perf_counter()
+        keys = self._backend.keys(pattern)
+        self._observe_op('keys', start)
+        return keys
+
+    def _update(self, key, fn, ex=None):
+        """key の読み出し→fn→書き込みを他スレッド/プロセスの更新と競合しないよう行う
+        fn(現在値 or None) が None を返したら書き込まない。書き込んだ値を返す
+        Redis: WATCH/MULTI による楽観ロック (競合したら再試行) / MemoryStore: キー単位のロック
+        """
+        start = time.perf_counter()
+        if not self.use_redis:
+            value = self._backend.update(key, fn, ex=ex)
         else:
-            import fnmatch
-            return [k for k in self._memory_store.keys() if fnmatch.fnmatch(k, pattern)]
+            with self._backend.pipeline() as pipe:
+                while True:
+                    try:
+                        pipe.watch(key)
+                        value = fn(pipe.get(key))
+                        if value is None:
+                            pipe.unwatch()
+                            break
+                        pipe.multi()
+                        pipe.set(key, value, ex=ex)
+                        pipe.execute()
+                        break
+                    except redis.WatchError:
+                        continue
+        self._observe_op('update', start)
+        return value
+
+    def _update_json(self, key, mutate, ex=None, default=None):
+        """JSONレコードを mutate(dict) で更新し、更新後の dict を返す
+        キーがなければ default() から作る (default=None なら何もせず None)
+        """
+        result = {}
+
+        def apply(data):
+            if data:
+                record = json.loads(data)
+            elif default is not None:
+                record = default()
+            else:
+                return None
+            mutate(record)
+            result['record'] = record
+            return json.dumps(record)
+
+        self._update(key, apply, ex=ex)
+        return result.get('record')
+
+    def backend_info(self):
+        """インメモリ時のキー数と使用量 (Redis時は None)"""
+        return None if self.use_redis else self._backend.info()
     
     
-    def update_worker_status(self, worker_url, status='online', metadata=None, is_processing=False):
-
+    def update_worker_status(self, worker_url, status='online', metadata=None, capacity=None):
+        """capacity: ヘルスチェックで得た {'slots': 同時処理数, 'model': モデル名}"""
         key = f"worker:{worker_url}"
-        # 既存データがあればpending_chunksとperformance_historyを維持
-        existing = self._get(key)
-        pending_chunks = 0
-        performance_history = []
-        if existing:
-            try:
-                existing_data = json.loads(existing)
-                pending_chunks = existing_data.get('pending_chunks', 0)
-                performance_history = existing_data.get('performance_history', [])
-            except:
-                pass
-        data = {
-            'url': worker_url,
-            'status': status,
-            'is_processing': is_processing,
-            'last_updated': datetime.now().isoformat(),
-            'metadata': metadata or {},
-            'pending_chunks': pending_chunks,
-            'performance_history': performance_history  # [{chunk_duration_sec, processing_time_sec, speed_ratio}]
-        }
-        self._set(key, json.dumps(data), ex=300)
+        capacity = capacity or {}
+
+        def apply(data):
+            # 既存データがあればpending_chunks・スロット使用数を維持 (性能の記録は telemetry:* 側)
+            existing_data = {}
+            if data:
+                try:
+                    existing_data = json.loads(data)
+                except:
+                    pass
+            # このプロセスの lease だけを残す (再起動等で返却されなかったスロットを回収する)
+            own = (existing_data.get('leases') or {}).get(self.owner_id, {'slots': 0, 'audio_sec': 0})
+            slots_in_use = own['slots']
+            stale_slots = existing_data.get('slots_in_use', 0) - slots_in_use
+            pending_chunks = existing_data.get('pending_chunks', 0)
+            pending_audio_sec = existing_data.get('pending_audio_sec', 0)
+            if stale_slots > 0:
+                print(f"[Redis] Reclaimed {stale_slots} stale slot(s) on {worker_url}")
+                pending_chunks = max(0, pending_chunks - stale_slots)
+                pending_audio_sec = own['audio_sec']
+            # 処理中のスロットが残っている間は online ではなく busy
+            current_status = 'busy' if status == 'online' and slots_in_use > 0 else status
+            return json.dumps({
+                'url': worker_url,
+                'status': current_status,
+                'is_processing': slots_in_use > 0,
+                'slots': max(1, int(capacity.get('slots') or existing_data.get('slots', 1))),
+                'slots_in_use': slots_in_use,
+                'leases': {self.owner_id: own} if slots_in_use else {},
+                'model': capacity.get('model') or existing_data.get('model'),
+                'last_updated': datetime.now().isoformat(),
+                'metadata': metadata or {},
+                'pending_chunks': pending_chunks,
+                'pending_audio_sec': pending_audio_sec
+            })
+
+        self._update(key, apply, ex=300)
     
     def get_worker_status(self, worker_url):
         key = f"worker:{worker_url}"
@@ -98,16 +193,44 @@ class RedisManager:
     def mark_worker_idle(self, worker_url):
         self.update_worker_status(worker_url, status='online')
     
-    def set_worker_processing(self, worker_url, is_processing):
-        key = f"worker:{worker_url}"
-        existing = self._get(key)
-        if existing:
-            try:
-                data = json.loads(existing)
-                data['is_processing'] = is_processing
-                self._set(key, json.dumps(data), ex=300)
-            except:
-                pass
+    def acquire_worker_slot(self, worker_url, job_id=None, audio_sec=0):
+        """スロットを1つ確保し、pending_chunks/pending_audio_sec を加算 (1回の読み書きで反映)
+        確保数はプロセス毎の lease (leases[owner_id]) にも記録する
+        """
+        def apply(worker_data):
+            lease = worker_data.setdefault('leases', {}).setdefault(self.owner_id, {'slots': 0, 'audio_sec': 0})
+            lease['slots'] += 1
+            lease['audio_sec'] += audio_sec
+            worker_data['slots_in_use'] = worker_data.get('slots_in_use', 0) + 1
+            worker_data['pending_chunks'] = worker_data.get('pending_chunks', 0) + 1
+            worker_data['pending_audio_sec'] = worker_data.get('pending_audio_sec', 0) + audio_sec
+            worker_data['is_processing'] = True
+            worker_data['status'] = 'busy'
+            worker_data['metadata'] = {'job_id': job_id}
+            worker_data['last_updated'] = datetime.now().isoformat()
+        return self._update_json(f"worker:{worker_url}", apply, ex=300) is not None
+    
+    def release_worker_slot(self, worker_url, audio_sec=0, offline=False):
+        """acquire_worker_slot で確保したスロットを返却し、更新後のworker stateを返す"""
+        def apply(worker_data):
+            leases = worker_data.setdefault('leases', {})
+            lease = leases.get(self.owner_id)
+            if lease:
+                lease['slots'] -= 1
+                lease['audio_sec'] = max(0, lease['audio_sec'] - audio_sec)
+                if lease['slots'] <= 0:
+                    del leases[self.owner_id]
+            in_use = max(0, worker_data.get('slots_in_use', 0) - 1)
+            worker_data['slots_in_use'] = in_use
+            worker_data['pending_chunks'] = max(0, worker_data.get('pending_chunks', 0) - 1)
+            worker_data['pending_audio_sec'] = max(0, worker_data.get('pending_audio_sec', 0) - audio_sec)
+            worker_data['is_processing'] = in_use > 0
+            if offline:
+                worker_data['status'] = 'offline'
+            else:
+                worker_data['status'] = 'busy' if in_use > 0 else 'online'
+            worker_data['last_updated'] = datetime.now().isoformat()
+        return self._update_json(f"worker:{worker_url}", apply, ex=300)
     
     def add_worker(self, worker_url):
         self.update_worker_status(worker_url, status='online')
@@ -120,53 +243,85 @@ class RedisManager:
         workers = self.get_all_workers()
         return [w['url'] for w in workers]
     
-    def increment_worker_pending(self, worker_url):
-        key = f"worker:{worker_url}"
-        data = self._get(key)
-        if data:
-            worker_data = json.loads(data)
+    def increment_worker_pending(self, worker_url, audio_sec=0):
+        def apply(worker_data):
             worker_data['pending_chunks'] = worker_data.get('pending_chunks', 0) + 1
-            self._set(key, json.dumps(worker_data), ex=300)
-    
-    def decrement_worker_pending(self, worker_url):
-        key = f"worker:{worker_url}"
-        data = self._get(key)
-        if data:
-            worker_data = json.loads(data)
-            current = worker_data.get('pending_chunks', 0)
-            worker_data['pending_chunks'] = max(0, current - 1)
-            self._set(key, json.dumps(worker_data), ex=300)
-    
-    def record_worker_performance(self, worker_url, chunk_duration_sec, processing_time_sec):
-        """チャンク処理のパフォーマンスを記録 (最大20件)"""
-        key = f"worker:{worker_url}"
-        data = self._get(key)
-        if data:
-            worker_data = json.loads(data)
-            history = worker_data.get('performance_history', [])
-            speed_ratio = processing_time_sec / chunk_duration_sec if chunk_duration_sec > 0 else 1.0
-            history.append({
-                'chunk_duration_sec': chunk_duration_sec,
-                'processing_time_sec': processing_time_sec,
-                'speed_ratio': speed_ratio,
-                'timestamp': datetime.now().isoformat()
-            })
-            # 最新20件のみ保持
-            worker_data['performance_history'] = history[-20:]
-            self._set(key, json.dumps(worker_data), ex=300)
-    
-    def get_worker_avg_speed_ratio(self, worker_url):
-        """平均速度比を取得 (低いほど高速)"""
-        worker_info = self.get_worker_info(worker_url)
-        if not worker_info:
-            return 1.0
-        history = worker_info.get('performance_history', [])
-        if not history:
+            worker_data['pending_audio_sec'] = worker_data.get('pending_audio_sec', 0) + audio_sec
+        self._update_json(f"worker:{worker_url}", apply, ex=300)
+    
+    def decrement_worker_pending(self, worker_url, audio_sec=0):
+        def apply(worker_data):
+            worker_data['pending_chunks'] = max(0, worker_data.get('pending_chunks', 0) - 1)
+            worker_data['pending_audio_sec'] = max(0, worker_data.get('pending_audio_sec', 0) - audio_sec)
+        self._update_json(f"worker:{worker_url}", apply, ex=300)
+    
+    def record_worker_performance(self, worker_url, chunk_duration_sec, processing_time_sec, model=None):
+        """チャンク処理のパフォーマンスを (worker, model) 単位のテレメトリに記録
+        worker:{url} (TTL 300秒) とは別キーで TTL なしで保持するので、worker が一時的に消えても残る
+        - telemetry:{url}: モデル毎の要約 (選択時はこれだけ読む)
+        - telemetry_detail:{url}#{model}: ヒストグラム・時系列・直近サンプル
+        """
+        if model is None:
+            worker_info = self.get_worker_info(worker_url)
+            model = (worker_info or {}).get('model')
+        model = model or 'unknown'
+
+        record = self._update_json(
+            f"telemetry_detail:{worker_url}#{model}",
+            lambda r: telemetry.update_model_record(r, chunk_duration_sec, processing_time_sec),
+            default=telemetry.new_model_record
+        )
+
+        def apply_summary(summary):
+            summary['models'][model] = telemetry.summarize(record)
+            summary['model'] = model
+        self._update_json(f"telemetry:{worker_url}", apply_summary,
+                          default=lambda: {'url': worker_url, 'models': {}})
+
+    def get_worker_speed_summary(self, worker_url, model=None):
+        """選択用: モデルの {ewma_speed, samples, updated_at} (1回の読み出し)
+        model 省略時は最後に記録されたモデル。記録がなければ None
+        """
+        data = self._get(f"telemetry:{worker_url}")
+        if not data:
+            return None
+        summary = json.loads(data)
+        return summary['models'].get(model or summary.get('model'))
+
+    def get_worker_avg_speed_ratio(self, worker_url, model=None):
+        """平均速度比 (EWMA) を取得 (低いほど高速)。記録がなければ 1.0"""
+        summary = self.get_worker_speed_summary(worker_url, model)
+        if not summary or summary.get('ewma_speed') is None:
             return 1.0
-        # 最新10件の平均
-        recent = history[-10:]
-        avg = sum(h['speed_ratio'] for h in recent) / len(recent)
-        return avg
+        return summary['ewma_speed']
+
+    def get_worker_telemetry(self, worker_url):
+        """worker の全モデルのテレメトリ (要約 + ヒストグラム・時系列)"""
+        data = self._get(f"telemetry:{worker_url}")
+        if not data:
+            return None
+        summary = json.loads(data)
+        models = {}
+        for model in summary['models']:
+            detail = self._get(f"telemetry_detail:{worker_url}#{model}")
+            if detail:
+                models[model] = json.loads(detail)
+        return {'url': worker_url, 'model': summary.get('model'), 'models': models}
+
+    def get_all_worker_telemetry(self):
+        result = []
+        for key in self._keys("telemetry:*"):
+            worker_telemetry = self.get_worker_telemetry(key[len("telemetry:"):])
+            if worker_telemetry:
+                result.append(worker_telemetry)
+        return result
+
+    def delete_worker_telemetry(self, worker_url):
+        data = self._get(f"telemetry:{worker_url}")
+        if data:
+            for model in json.loads(data)['models']:
+                self._delete(f"telemetry_detail:{worker_url}#{model}")
+        self._delete(f"telemetry:{worker_url}")
     
     
     def set_user_preference(self, user_id, key, value):
@@ -182,7 +337,7 @@ class RedisManager:
             return json.loads(data)
         return default
     
-    def create_job(self, job_id, filename, total_chunks=0):
+    def create_job(self, job_id, filename, total_chunks=0, priority=None):
         key = f"job:{job_id}"
         data = {
             'job_id': job_id,
@@ -192,40 +347,53 @@ class RedisManager:
             'completed_chunks': 0,
             'created_at': datetime.now().isoformat(),
             'updated_at': datetime.now().isoformat(),
-            'chunks': []
+            'chunks': [],
+            'priority': priority,
+            'stages': {}  # {stage: {started_at, duration_ms}}
         }
         self._set(key, json.dumps(data), ex=3600)
         return job_id
     
-    def update_job_status(self, job_id, status):
-        key = f"job:{job_id}"
-        data = self._get(key)
-        if data:
-            job_data = json.loads(data)
-            job_data['status'] = status
+    def _touch_job(self, job_id, mutate):
+        """job:{id} を mutate で更新し updated_at を付ける (レコードがなければ何もしない)"""
+        def apply(job_data):
+            mutate(job_data)
             job_data['updated_at'] = datetime.now().isoformat()
-            self._set(key, json.dumps(job_data), ex=3600)
-    
-    def add_chunk_to_job(self, job_id, chunk_id, worker_url):
-        key = f"job:{job_id}"
-        data = self._get(key)
-        if data:
-            job_data = json.loads(data)
-            chunk_info = {
-                'chunk_id': chunk_id,
-                'worker_url': worker_url,
-                'status': 'processing',
-                'started_at': datetime.now().isoformat()
-            }
-            job_data['chunks'].append(chunk_info)
-            job_data['updated_at'] = datetime.now().isoformat()
-            self._set(key, json.dumps(job_data), ex=3600)
+        return self._update_json(f"job:{job_id}", apply, ex=3600)
+
+    def update_job_status(self, job_id, status):
+        self._touch_job(job_id, lambda job_data: job_data.update(status=status))
+    
+    def update_job_fields(self, job_id, **fields):
+        """ジョブレコードの任意フィールドを更新 (queue_position / eta_sec など)"""
+        self._touch_job(job_id, lambda job_data: job_data.update(fields))
+    
+    def record_job_stage(self, job_id, stage, duration_sec, started_at=None):
+        """ステージの所要時間をジョブに記録 (同名ステージは加算)"""
+        def apply(job_data):
+            stages = job_data.setdefault('stages', {})
+            span = stages.get(stage)
+            if span:
+                span['duration_ms'] += int(duration_sec * 1000)
+            else:
+                stages[stage] = {
+                    'started_at': datetime.fromtimestamp(started_at or time.time()).isoformat(),
+                    'duration_ms': int(duration_sec * 1000)
+                }
+        self._update_json(f"job:{job_id}", apply, ex=3600)
+    
+    def add_chunk_to_job(self, job_id, chunk_id, worker_url, duration_sec=None):
+        chunk_info = {
+            'chunk_id': chunk_id,
+            'worker_url': worker_url,
+            'duration_sec': duration_sec,
+            'status': 'processing',
+            'started_at': datetime.now().isoformat()
+        }
+        self._touch_job(job_id, lambda job_data: job_data['chunks'].append(chunk_info))
     
-    def complete_chunk(self, job_id, chunk_id, result=None):
-        key = f"job:{job_id}"
-        data = self._get(key)
-        if data:
-            job_data = json.loads(data)
+    def complete_chunk(self, job_id, chunk_id, result=None, timings=None):
+        def apply(job_data):
             for chunk in job_data['chunks']:
                 if chunk['chunk_id'] == chunk_id:
                     chunk['status'] = 'completed'
@@ -235,17 +403,28 @@ class RedisManager:
                             'text_length': len(result.get('text', '')),
                             'segments_count': len(result.get('segments', []))
                         }
+                    if timings:
+                        chunk['timings'] = timings
                     break
             
             job_data['completed_chunks'] = sum(
                 1 for c in job_data['chunks'] if c['status'] == 'completed'
             )
-            job_data['updated_at'] = datetime.now().isoformat()
             
             if job_data['completed_chunks'] == job_data['total_chunks']:
                 job_data['status'] = 'aggregating'
-            
-            self._set(key, json.dumps(job_data), ex=3600)
+        
+        self._touch_job(job_id, apply)
+    
+    def mark_job_cancelled(self, job_id):
+        """ジョブをキャンセル済みにし、応答待ちだったチャンクも cancelled にする"""
+        def apply(job_data):
+            job_data['status'] = 'cancelled'
+            job_data['cancelled_at'] = datetime.now().isoformat()
+            for chunk in job_data['chunks']:
+                if chunk['status'] == 'processing':
+                    chunk['status'] = 'cancelled'
+        return self._touch_job(job_id, apply)
     
     def get_job_status(self, job_id):
         key = f"job:{job_id}"
@@ -268,6 +447,11 @@ class RedisManager:
     def delete_job(self, job_id):
         key = f"job:{job_id}"
         self._delete(key)
+
+    def is_job_active(self, job_id):
+        """ジョブ記録があり、まだ終了していないか (作業ディレクトリの回収判定用)"""
+        job = self.get_job_status(job_id)
+        return bool(job) and job.get('status') not in FINISHED_JOB_STATUSES
     
     
     def get_stats(self):
@@ -278,6 +462,7 @@ class RedisManager:
         busy_workers = sum(1 for w in workers if w['status'] == 'busy')
         
         active_jobs = sum(1 for j in jobs if j['status'] in ['processing', 'aggregating'])
+        queued_jobs = sum(1 for j in jobs if j['status'] == 'queued')
         completed_jobs = sum(1 for j in jobs if j['status'] == 'completed')
         
         return {
@@ -290,6 +475,8 @@ class RedisManager:
             'jobs': {
                 'total': len(jobs),
                 'active': active_jobs,
+                'queued': queued_jobs,
                 'completed': completed_jobs
-            }
+            },
+            'store': dict(self.backend_info() or {}, backend='redis' if self.use_redis else 'memory')
         }
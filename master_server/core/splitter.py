@@ -1,8 +1,15 @@
 import os
+import time
 from pydub import AudioSegment
 from pydub.silence import detect_nonsilent
 
-def split_audio(file_path, output_dir, min_len=30000, silence_thresh=None, silence_len=700):
+def split_audio(file_path, output_dir, min_len=30000, silence_thresh=None, silence_len=700, timings=None,
+                sources=None):
+    """timings に dict を渡すと decode/detect/export の所要秒数を書き込む
+    sources に list を渡すと、チャンク毎に元音声上の区間のリスト
+    [{'source_offset_ms', 'length_ms'}, ...] を追加する (無音を除いて連結するため、チャンク内の位置は区間毎に元音声とずれる)
+    """
+    stage_start = time.perf_counter()
     print(f"[Splitter] Loading {file_path}...")
     audio = AudioSegment.from_file(file_path)
     
@@ -13,6 +20,9 @@ def split_audio(file_path, output_dir, min_len=30000, silence_thresh=None, silen
     
     avg_dbfs = audio.dBFS
     print(f"[Splitter] Average dBFS: {avg_dbfs:.1f}")
+    if timings is not None:
+        timings['decode'] = time.perf_counter() - stage_start
+        stage_start = time.perf_counter()
     
     if silence_thresh is None:
         dynamic_thresh = avg_dbfs - 12
@@ -30,6 +40,8 @@ def split_audio(file_path, output_dir, min_len=30000, silence_thresh=None, silen
     )
     
     chunks = []
+    # chunks と同じ並びで、各チャンクの元音声上の (開始ms, 長さms)
+    chunk_ranges = []
     
     if len(nonsilent_ranges) == 0:
         # 無音検出に失敗した場合は固定時間で分割
@@ -38,6 +50,7 @@ def split_audio(file_path, output_dir, min_len=30000, silence_thresh=None, silen
         for start in range(0, total_duration, chunk_size):
             end = min(start + chunk_size, total_duration)
             chunks.append(audio[start:end])
+            chunk_ranges.append([(start, len(chunks[-1]))])
     else:
         # 無音区間で分割
         print(f"[Splitter] Found {len(nonsilent_ranges)} non-silent segments")
@@ -65,25 +78,37 @@ def split_audio(file_path, output_dir, min_len=30000, silence_thresh=None, silen
             chunk_start = max(0, start - 500)
             chunk_end = min(total_duration, end + 500)
             chunks.append(audio[chunk_start:chunk_end])
+            chunk_ranges.append([(chunk_start, len(chunks[-1]))])
     
     # 短いチャンクを結合して最小長さを確保
     print(f"[Splitter] Merging short chunks (min length: {min_len/1000}s)...")
     merged_chunks = []
+    merged_sources = []
     current_chunk = None
+    current_ranges = None
 
-    for chunk in chunks:
+    for chunk, ranges in zip(chunks, chunk_ranges):
         if current_chunk is None:
             current_chunk = chunk
+            current_ranges = list(ranges)
         else:
             # 現在の塊が指定長未満なら結合
             if len(current_chunk) < min_len:
                 current_chunk += chunk
+                current_ranges.extend(ranges)
             else:
                 merged_chunks.append(current_chunk)
+                merged_sources.append(current_ranges)
                 current_chunk = chunk
+                current_ranges = list(ranges)
     
     if current_chunk:
         merged_chunks.append(current_chunk)
+        merged_sources.append(current_ranges)
+
+    if timings is not None:
+        timings['detect'] = time.perf_counter() - stage_start
+        stage_start = time.perf_counter()
 
     # ファイル書き出し
     chunk_paths = []
@@ -97,5 +122,10 @@ def split_audio(file_path, output_dir, min_len=30000, silence_thresh=None, silen
         chunk_paths.append(out_path)
         print(f"  - {out_name}: {len(chunk)/1000:.1f}s")
     
+    if timings is not None:
+        timings['export'] = time.perf_counter() - stage_start
+    if sources is not None:
+        sources.extend([{'source_offset_ms': start, 'length_ms': length} for start, length in ranges]
+                       for ranges in merged_sources)
     print(f"[Splitter] Created {len(chunk_paths)} chunks.")
     return chunk_paths
\ No newline at end of file
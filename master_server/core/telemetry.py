@@ -0,0 +1,102 @@
+import time
+from bisect import bisect_left
+
+# チャンク長 (秒) の区分。splitter の min_len 付近が中心
+DURATION_BUCKETS = (15, 30, 60, 90)
+# 処理時間 (秒) のヒストグラム境界。最後に +Inf の枠が付く
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300)
+# 速度比 (処理時間/音声長) のEWMA係数
+EWMA_ALPHA = 0.2
+# 直近サンプル (シミュレータのトレース用) と時系列の保持数
+RECENT_SAMPLES = 20
+SERIES_TIERS = (('1m', 60, 60), ('1h', 3600, 168))  # (名前, 解像度秒, 保持点数)
+
+
+def duration_bucket(chunk_duration_sec):
+    """チャンク長の区分ラベル ('0-15', '15-30', ..., '90+')"""
+    bounds = (0,) + DURATION_BUCKETS
+    i = bisect_left(DURATION_BUCKETS, chunk_duration_sec) if chunk_duration_sec > 0 else 0
+    if i >= len(DURATION_BUCKETS):
+        return f"{DURATION_BUCKETS[-1]}+"
+    return f"{bounds[i]}-{DURATION_BUCKETS[i]}"
+
+
+def new_model_record():
+    return {
+        'samples': 0,
+        'ewma_speed': None,
+        'updated_at': None,
+        'buckets': {},
+        'series': {name: [] for name, _, _ in SERIES_TIERS},
+        'recent': []
+    }
+
+
+def update_model_record(record, chunk_duration_sec, processing_time_sec, now=None):
+    """1チャンク分の計測を (worker, model) のテレメトリに反映し、速度比を返す
+
+    - ewma_speed: 速度比のEWMA (選択時に使う値)
+    - buckets: チャンク長区分ごとの件数・合計と処理時間ヒストグラム (非累積)
+    - series: 1分/1時間解像度にまとめた [開始時刻, 件数, 音声秒合計, 処理秒合計]
+    """
+    now = time.time() if now is None else now
+    speed_ratio = processing_time_sec / chunk_duration_sec if chunk_duration_sec > 0 else 1.0
+
+    record['samples'] += 1
+    if record['ewma_speed'] is None:
+        record['ewma_speed'] = speed_ratio
+    else:
+        record['ewma_speed'] += EWMA_ALPHA * (speed_ratio - record['ewma_speed'])
+    record['updated_at'] = now
+
+    bucket = record['buckets'].setdefault(duration_bucket(chunk_duration_sec), {
+        'count': 0, 'audio_sec': 0.0, 'processing_sec': 0.0,
+        'hist': [0] * (len(LATENCY_BUCKETS) + 1)
+    })
+    bucket['count'] += 1
+    bucket['audio_sec'] = round(bucket['audio_sec'] + chunk_duration_sec, 3)
+    bucket['processing_sec'] = round(bucket['processing_sec'] + processing_time_sec, 3)
+    bucket['hist'][bisect_left(LATENCY_BUCKETS, processing_time_sec)] += 1
+
+    for name, resolution, keep in SERIES_TIERS:
+        series = record['series'].setdefault(name, [])
+        start = int(now // resolution * resolution)
+        if series and series[-1][0] == start:
+            point = series[-1]
+        else:
+            point = [start, 0, 0.0, 0.0]
+            series.append(point)
+        point[1] += 1
+        point[2] = round(point[2] + chunk_duration_sec, 3)
+        point[3] = round(point[3] + processing_time_sec, 3)
+        del series[:-keep]
+
+    record['recent'].append({
+        'chunk_duration_sec': round(chunk_duration_sec, 3),
+        'speed_ratio': round(speed_ratio, 4)
+    })
+    del record['recent'][:-RECENT_SAMPLES]
+    return speed_ratio
+
+
+def summarize(record):
+    """選択時に読む要約 (モデル毎に ewma_speed と件数だけ)"""
+    return {
+        'ewma_speed': record['ewma_speed'],
+        'samples': record['samples'],
+        'updated_at': record['updated_at']
+    }
+
+
+def latency_quantile(bucket, q):
+    """ヒストグラムから処理時間の分位点を概算 (区間の上限を返す。+Inf枠は None)"""
+    total = sum(bucket['hist'])
+    if not total:
+        return None
+    target = q * total
+    seen = 0
+    for i, count in enumerate(bucket['hist']):
+        seen += count
+        if seen >= target:
+            return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else None
+    return None
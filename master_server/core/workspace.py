@@ -0,0 +1,185 @@
+import os
+import time
+import shutil
+import threading
+from core import metrics
+
+# tmpfs として使う候補 (Linux)
+TMPFS_ROOT = '/dev/shm/whisper-orchard'
+
+
+class WorkspaceQuotaExceeded(Exception):
+    """ジョブ単位または全体の作業領域の上限を超えた"""
+
+
+def _dir_usage(path):
+    total = 0
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        total += _dir_usage(entry.path)
+                    else:
+                        total += entry.stat(follow_symlinks=False).st_size
+                except FileNotFoundError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return total
+
+
+class WorkspaceManager:
+    """ジョブ毎の作業ディレクトリ (アップロード・チャンク) を管理する
+
+    - root/{job_id}/ をジョブ専用に割り当てるので、同名ファイルのジョブ同士でチャンクが衝突しない
+    - use_tmpfs=True なら /dev/shm 配下に置き、一時的なチャンクの書き出しをディスクに出さない
+    - account() でジョブ単位 (job_quota_bytes) と全体 (total_quota_bytes) の上限を確認する
+    - sweeper が登録されていない (クラッシュ等で残った) 作業ディレクトリを回収し、使用量を metrics に反映する
+      is_job_active(job_id) を渡すと、登録済みでもジョブ記録がない・終了したものを回収する
+    """
+
+    def __init__(self, root, job_quota_bytes, total_quota_bytes, use_tmpfs=False,
+                 sweep_interval_sec=60, orphan_grace_sec=300, is_job_active=None):
+        if use_tmpfs:
+            if os.path.isdir(os.path.dirname(TMPFS_ROOT)):
+                root = TMPFS_ROOT
+            else:
+                print(f"[Workspace] tmpfs not available, using {root}")
+        self.root = root
+        self.job_quota_bytes = job_quota_bytes
+        self.total_quota_bytes = total_quota_bytes
+        self.sweep_interval_sec = sweep_interval_sec
+        self.orphan_grace_sec = orphan_grace_sec
+        self.is_job_active = is_job_active
+        self._lock = threading.Lock()
+        self._usage = {}  # job_id -> bytes (最後に account() した時点)
+        self._created_at = {}  # job_id -> create() した時刻
+        self._sweeper = None
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, job_id):
+        return os.path.join(self.root, job_id)
+
+    def create(self, job_id):
+        path = self.path(job_id)
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            self._usage[job_id] = 0
+            self._created_at[job_id] = time.time()
+        return path
+
+    def has_room(self, incoming_bytes=0):
+        """新しいアップロードを受け付ける余地があるか (全体上限)"""
+        with self._lock:
+            used = sum(self._usage.values())
+        return used + (incoming_bytes or 0) <= self.total_quota_bytes
+
+    def account(self, job_id):
+        """作業ディレクトリの使用量を測り直し、上限を超えていれば WorkspaceQuotaExceeded"""
+        used = _dir_usage(self.path(job_id))
+        with self._lock:
+            self._usage[job_id] = used
+            total = sum(self._usage.values())
+        if used > self.job_quota_bytes:
+            raise WorkspaceQuotaExceeded(
+                f"Job workspace uses {used} bytes (limit {self.job_quota_bytes})")
+        if total > self.total_quota_bytes:
+            raise WorkspaceQuotaExceeded(
+                f"Scratch space uses {total} bytes (limit {self.total_quota_bytes})")
+        return used
+
+    def release(self, job_id):
+        """ジョブの作業ディレクトリを削除する (何度呼んでもよい)"""
+        with self._lock:
+            self._usage.pop(job_id, None)
+            self._created_at.pop(job_id, None)
+        shutil.rmtree(self.path(job_id), ignore_errors=True)
+
+    def sweep(self):
+        """orphan_grace_sec 以上更新のない作業ディレクトリのうち、未登録のものと
+        (is_job_active があれば) ジョブ記録がない・終了したものを削除し、削除したバイト数を返す
+        """
+        reclaimed = 0
+        now = time.time()
+        with self._lock:
+            registered = dict(self._created_at)
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            if entry.name in registered and self.is_job_active is None:
+                continue
+            try:
+                last_touched = max(entry.stat().st_mtime, registered.get(entry.name, 0))
+            except FileNotFoundError:
+                continue
+            if now - last_touched < self.orphan_grace_sec:
+                continue
+            if entry.name in registered:
+                # 受付途中の例外やスレッドの異常終了で release されずに残ったもの
+                if self.is_job_active(entry.name):
+                    continue
+                size = _dir_usage(entry.path)
+                self.release(entry.name)
+                print(f"[Workspace] Reclaimed workspace of inactive job {entry.name} ({size} bytes)")
+            else:
+                size = _dir_usage(entry.path)
+                shutil.rmtree(entry.path, ignore_errors=True)
+                print(f"[Workspace] Reclaimed orphaned workspace {entry.name} ({size} bytes)")
+            reclaimed += size
+        if reclaimed:
+            metrics.SCRATCH_RECLAIMED_BYTES_TOTAL.inc(reclaimed)
+        return reclaimed
+
+    def snapshot(self):
+        """使用量のレポート (/stats 用)"""
+        with self._lock:
+            used = sum(self._usage.values())
+            workspaces = len(self._usage)
+        try:
+            disk = shutil.disk_usage(self.root)
+            free, capacity = disk.free, disk.total
+        except OSError:
+            free, capacity = None, None
+        return {
+            'root': self.root,
+            'workspaces': workspaces,
+            'used_bytes': used,
+            'job_quota_bytes': self.job_quota_bytes,
+            'total_quota_bytes': self.total_quota_bytes,
+            'device_free_bytes': free,
+            'device_total_bytes': capacity
+        }
+
+    def _update_gauges(self):
+        # 実行中ジョブの使用量も測り直す (account() の呼び出し間のチャンク削除を反映)
+        with self._lock:
+            job_ids = list(self._usage)
+        for job_id in job_ids:
+            used = _dir_usage(self.path(job_id))
+            with self._lock:
+                if job_id in self._usage:
+                    self._usage[job_id] = used
+        snapshot = self.snapshot()
+        metrics.SCRATCH_USED_BYTES.set(snapshot['used_bytes'])
+        metrics.SCRATCH_WORKSPACES.set(snapshot['workspaces'])
+        if snapshot['device_free_bytes'] is not None:
+            metrics.SCRATCH_DEVICE_FREE_BYTES.set(snapshot['device_free_bytes'])
+
+    def _sweep_loop(self):
+        while True:
+            try:
+                self.sweep()
+                self._update_gauges()
+            except Exception as e:
+                print(f"[Workspace] Sweep failed: {e}")
+            time.sleep(self.sweep_interval_sec)
+
+    def start_sweeper(self):
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._sweep_loop, daemon=True)
+            self._sweeper.start()
@@ -142,8 +142,12 @@ createApp({
             } else if (data.status === 'completed') {
                 status.value = 'idle';
             } else if (data.status === 'failed') {
-                status.value = 'idle';
+                resetJob();
                 errorMessage.value = data.error || 'ジョブが失敗しました';
+                return;
+            } else if (data.status === 'cancelled') {
+                resetJob();
+                return;
             }
             // チャンク進捗更新
             if (data.chunks && data.chunks.length > 0) {
@@ -162,10 +166,14 @@ createApp({
                     }
                 });
             }
-            // 完了時結果表示
-            if (data.status === 'completed' && data.result && data.result.text) {
-                resultSegments.value = data.result.segments || [];
-                finishProcess(data.result.text);
+            // 完了時結果表示 (結果が空でも次のジョブを開始できるよう状態は戻す)
+            if (data.status === 'completed') {
+                if (data.result && data.result.text) {
+                    resultSegments.value = data.result.segments || [];
+                    finishProcess(data.result.text);
+                } else {
+                    resetJob();
+                }
             }
         });
 
@@ -223,6 +231,10 @@ createApp({
                     method: 'POST',
                     body: formData
                 });
+                if (response.status === 429) {
+                    const body = await response.json().catch(() => ({}));
+                    throw new Error(`サーバーが混雑しています。${body.retry_after_sec || ''}秒後に再試行してください`);
+                }
                 if (!response.ok) {
                     throw new Error('Server returned error: ' + response.status);
                 }
@@ -246,13 +258,28 @@ createApp({
             }
         };
 
-        const finishProcess = async (text) => {
-            await new Promise(r => setTimeout(r, 500));
+        // 実行中ジョブのキャンセル (待機中チャンクの破棄と応答待ちの放棄はサーバ側で行う)
+        const cancelJob = () => {
+            if (!currentJobId.value) return;
+            socket.emit('cancel_job', { job_id: currentJobId.value }, (ack) => {
+                if (ack && ack.error) {
+                    errorMessage.value = 'キャンセルできませんでした\n\n' + ack.error;
+                }
+            });
+        };
+
+        // ジョブ終了時 (完了・失敗・キャンセル) に開始ボタンへ戻す
+        const resetJob = () => {
             stopPolling();
             status.value = 'idle';
             currentJobId.value = null;
             currentJobStatus.value = 'idle';
             workers.value.forEach(w => w.progress = 0);
+        };
+
+        const finishProcess = async (text) => {
+            await new Promise(r => setTimeout(r, 500));
+            resetJob();
             
             for (let i = 0; i < text.length; i++) {
                 resultText.value += text[i];
@@ -327,7 +354,8 @@ createApp({
                 'processing': 'bg-purple-100 text-purple-600',
                 'aggregating': 'bg-indigo-100 text-indigo-600',
                 'completed': 'bg-green-100 text-green-600',
-                'failed': 'bg-red-100 text-red-600'
+                'failed': 'bg-red-100 text-red-600',
+                'cancelled': 'bg-gray-200 text-gray-500'
             };
             return classes[status] || 'bg-gray-100 text-gray-600';
         };
@@ -389,6 +417,7 @@ createApp({
             stats,
             selectedJob,
             showJobDetail,
+            currentJobId,
             currentJobStatus,
             usePurifier,
             purifierCompleted,
@@ -396,6 +425,7 @@ createApp({
             handleDrop,
             handleFileSelect,
             startProcess,
+            cancelJob,
             copyText,
             copySegments,
             copySelectedJobText,
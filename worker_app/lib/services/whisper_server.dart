@@ -16,6 +16,8 @@ class WhisperServer {
   final Function(int timeMs) onJobCompleted;
   final Function(String error) onError;
   final Function(String modelName) onModelPreparationNeeded;
+  // 同時に推論できるリクエスト数 (ヘルスチェックでマスターに通知)
+  final int slots;
 
   WhisperServer({
     required this.getModel,
@@ -26,6 +28,7 @@ class WhisperServer {
     required this.onJobCompleted,
     required this.onError,
     required this.onModelPreparationNeeded,
+    this.slots = 1,
   });
 
   // タイムスタンプ整形用ヘルパー関数
@@ -62,9 +65,15 @@ class WhisperServer {
   Future<void> start() async {
     final router = shelf_router.Router();
 
+    // ヘルスチェック: マスターはここで同時処理スロット数とモデル名を取得する
     router.get('/', (Request request) {
       return Response.ok(
-        'Whisper Worker Node Active (Model: ${getSelectedModelName()})',
+        jsonEncode({
+          'status': 'active',
+          'model': getSelectedModelName(),
+          'slots': slots,
+        }),
+        headers: {'content-type': 'application/json; charset=utf-8'},
       );
     });
 